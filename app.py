@@ -1,17 +1,93 @@
-from flask import Flask, render_template
-import main
+from flask import Flask, abort, g, jsonify, request, Response
+from service import RecommendationService
+from persistence import RecommendationStore
+from cache import RecommendationCache, SQLiteCacheBackend
+from metrics import metrics
 import os
+import threading
+import time
 
 app = Flask(__name__)
 
+DEFAULT_USER_ID = 'C1140'
+DEFAULT_TOP_K = 6
+MAX_TOP_K = 100
+# Recommendations stored within this window are served from the database instead of recomputed
+RECOMMENDATION_MAX_AGE_SECONDS = 3600
+CACHE_MAX_SIZE = 50000
+# Products shown to a user within this window are not recommended to them again
+RECENTLY_SHOWN_SECONDS = 7 * 24 * 3600
+# Catalog shards ranked in parallel per request; worth raising only for very large catalogs
+SCORING_SHARDS = int(os.environ.get('RECOMMENDER_SHARDS', 1))
+
+if os.environ.get('RECOMMENDER_PROFILE'):
+    metrics.enable_profiling()
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_service():
+    # Built once per process and shared by every request
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                store = RecommendationStore()
+                cache = RecommendationCache(max_size=CACHE_MAX_SIZE, ttl_seconds=RECOMMENDATION_MAX_AGE_SECONDS,
+                                            backend=SQLiteCacheBackend(store, max_size=CACHE_MAX_SIZE))
+                _service = RecommendationService(store=store, max_age_seconds=RECOMMENDATION_MAX_AGE_SECONDS,
+                                                 cache=cache, shards=SCORING_SHARDS,
+                                                 exclude_shown_seconds=RECENTLY_SHOWN_SECONDS, served=True)
+    return _service
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None and request.endpoint is not None:
+        metrics.record(f'http_{request.endpoint}', time.perf_counter() - start)
+        metrics.count(f'http_responses_{response.status_code}')
+    return response
+
 @app.route('/')
 def home():
-    
-    main.main()  
-    
-    with open('recommendations.html', 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    return html_content
+    # Streamed straight from the template; nothing is written to disk
+    return Response(get_service().get_recommendations_html_stream(DEFAULT_USER_ID, DEFAULT_TOP_K), mimetype='text/html')
+
+@app.route('/recommendations/<user_id>')
+def recommendations(user_id):
+    service = get_service()
+    if not service.has_user(user_id):
+        abort(404, description=f"User ID {user_id} not found.")
+    # Parsed explicitly: type=int would silently fall back to the default for ?k=abc
+    try:
+        top_k = int(request.args.get('k', DEFAULT_TOP_K))
+    except ValueError:
+        top_k = None
+    if top_k is None or not 1 <= top_k <= MAX_TOP_K:
+        abort(400, description=f"k must be an integer between 1 and {MAX_TOP_K}.")
+    if request.args.get('format', 'json') == 'html':
+        return Response(service.get_recommendations_html_stream(user_id, top_k), mimetype='text/html')
+    return jsonify(service.get_recommendations_json(user_id, top_k))
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(get_service().cache.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text format by default, ?format=json for the raw snapshot
+    cache = get_service().cache
+    if request.args.get('format') == 'json':
+        snapshot = metrics.snapshot()
+        snapshot['cache'] = cache.stats()
+        return jsonify(snapshot)
+    gauges = {f'cache_{name}': value for name, value in cache.stats().items()}
+    return Response(metrics.to_prometheus(gauges=gauges), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    get_service()
     app.run(debug=True)
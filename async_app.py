@@ -0,0 +1,171 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from app import get_service, DEFAULT_USER_ID, DEFAULT_TOP_K, MAX_TOP_K
+from metrics import metrics
+
+# How long the first request of a batch waits for others to join it
+BATCH_WINDOW_SECONDS = 0.002
+MAX_BATCH_SIZE = 256
+
+
+class RecommendationBatcher:
+    """Serves recommendations to asyncio code in micro-batches.
+
+    Requests arriving within window_seconds of the first request of a batch,
+    up to max_batch_size, are answered by one RecommendationService.recommend_batch
+    call on the executor, so the event loop never runs the scoring itself.
+    Concurrent requests for the same (user_id, top_k) share one computation.
+    """
+
+    def __init__(self, service, window_seconds=BATCH_WINDOW_SECONDS, max_batch_size=MAX_BATCH_SIZE, executor=None):
+        self.service = service
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        # One worker: batches are scored one after another, each with a single vectorized call
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommend')
+        self._pending = {}  # (user_id, top_k) -> future, waiting for the next batch
+        self._in_flight = {}  # (user_id, top_k) -> future, until its batch finishes
+        self._flush_handle = None
+
+    async def recommend(self, user_id, top_k):
+        key = (user_id, top_k)
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._in_flight[key] = future
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+        else:
+            metrics.count('batcher_coalesced')
+        # Shielded so one cancelled caller does not cancel the result others are waiting for
+        return list(await asyncio.shield(future))
+
+    async def run(self, func, *args):
+        """Run other blocking service work (e.g. rendering) on the executor."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        keys = list(batch)
+        try:
+            with metrics.timer('recommend_batch'):
+                results = await self.run(self._compute, keys)
+        except Exception as e:
+            results = [e] * len(keys)
+        finally:
+            for key in keys:
+                self._in_flight.pop(key, None)
+        for key, result in zip(keys, results):
+            future = batch[key]
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _compute(self, keys):
+        metrics.count('batches')
+        metrics.count('batched_requests', len(keys))
+        known = [i for i, (user_id, _) in enumerate(keys) if self.service.has_user(user_id)]
+        results = [ValueError(f"User ID {user_id} not found in customer IDs.") for user_id, _ in keys]
+        for i, recommendations in zip(known, self.service.recommend_batch([keys[i] for i in known])):
+            results[i] = recommendations
+        return results
+
+
+class RecommendationASGIApp:
+    """ASGI counterpart of the Flask app's / and /recommendations/<user_id> routes, backed by a RecommendationBatcher.
+
+    Needs only an ASGI server, e.g. ``uvicorn async_app:app``. The service is
+    built once at startup, with the same store and cache wiring as the Flask app.
+    """
+
+    def __init__(self, service_factory=get_service, **batcher_options):
+        self.service_factory = service_factory
+        self.batcher_options = batcher_options
+        self.batcher = None
+
+    async def startup(self):
+        if self.batcher is None:
+            loop = asyncio.get_running_loop()
+            service = await loop.run_in_executor(None, self.service_factory)
+            self.batcher = RecommendationBatcher(service, **self.batcher_options)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await self.startup()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    if self.batcher is not None:
+                        self.batcher.executor.shutdown(wait=False)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        await self.startup()
+        with metrics.timer('http_async_recommendations'):
+            status, content_type, body = await self.handle(scope['method'], scope['path'],
+                                                           parse_qs(scope.get('query_string', b'').decode()))
+        metrics.count(f'http_responses_{status}')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def handle(self, method, path, query):
+        """(status, content type, body) for one request."""
+        if method != 'GET':
+            return _error(405, "Method not allowed.")
+        if path == '/':
+            user_id, top_k, output = DEFAULT_USER_ID, DEFAULT_TOP_K, 'html'
+        elif path.startswith('/recommendations/') and path.count('/') == 2:
+            user_id = path[len('/recommendations/'):]
+            try:
+                top_k = int(query.get('k', [DEFAULT_TOP_K])[0])
+            except ValueError:
+                top_k = None
+            output = query.get('format', ['json'])[0]
+            if not self.batcher.service.has_user(user_id):
+                return _error(404, f"User ID {user_id} not found.")
+            if top_k is None or not 1 <= top_k <= MAX_TOP_K:
+                return _error(400, f"k must be an integer between 1 and {MAX_TOP_K}.")
+        else:
+            return _error(404, "Not found.")
+
+        service = self.batcher.service
+        recommendations = await self.batcher.recommend(user_id, top_k)
+        if output == 'html':
+            html_content = await self.batcher.run(service.recommendations_html, user_id, top_k, recommendations)
+            return 200, 'text/html; charset=utf-8', html_content.encode('utf-8')
+        payload = await self.batcher.run(service.recommendations_json, user_id, top_k, recommendations)
+        return 200, 'application/json', json.dumps(payload).encode('utf-8')
+
+
+def _error(status, description):
+    return status, 'application/json', json.dumps({'error': description}).encode('utf-8')
+
+
+app = RecommendationASGIApp()
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving the ASGI app needs an ASGI server: pip install uvicorn")
+    uvicorn.run(app)
@@ -0,0 +1,81 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from persistence import RecommendationStore, DB_PATH
+from service import RecommendationService, CUSTOMER_DATA_PATH, PRODUCT_DATA_PATH, CATALOG_CACHE_PATH
+
+# One service per worker process, built by _init_worker
+_service = None
+
+def _init_worker(customer_data_path, product_data_path, catalog_cache_path):
+    global _service
+    _service = RecommendationService(customer_data_path, product_data_path, catalog_cache_path)
+
+def _recommend_chunk(user_ids, top_k, block_size):
+    recommendations = _service.rec_agent.get_recommendations_batch(user_ids, top_k, block_size=block_size)
+    return [(user_id, product_id) for user_id, product_ids in zip(user_ids, recommendations) for product_id in product_ids]
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def run_batch(top_k=6, workers=None, chunk_size=500, block_size=256, db_path=DB_PATH,
+              customer_data_path=CUSTOMER_DATA_PATH, product_data_path=PRODUCT_DATA_PATH,
+              catalog_cache_path=CATALOG_CACHE_PATH):
+    """Compute top_k recommendations for every customer and stream them into the recommendations table."""
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    # Building the service here also writes the catalog cache the workers start from
+    _init_worker(customer_data_path, product_data_path, catalog_cache_path)
+    user_ids = _service.catalog.customer_ids
+    init_seconds = time.perf_counter() - start
+
+    store = RecommendationStore(db_path)
+    chunks = list(_chunks(user_ids, chunk_size))
+    executor = None
+    n_rows = 0
+    try:
+        if workers == 1:
+            results = (_recommend_chunk(chunk, top_k, block_size) for chunk in chunks)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(customer_data_path, product_data_path, catalog_cache_path))
+            results = executor.map(_recommend_chunk, chunks, [top_k] * len(chunks), [block_size] * len(chunks))
+        # Results arrive chunk by chunk and are committed as they come in
+        for rows in results:
+            store.save_recommendations(rows)
+            n_rows += len(rows)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'users': len(user_ids),
+        'rows': n_rows,
+        'workers': workers,
+        'init_seconds': init_seconds,
+        'total_seconds': elapsed,
+        'users_per_second': len(user_ids) / elapsed if elapsed > 0 else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute top-k recommendations for every customer.")
+    parser.add_argument('--top-k', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Users per task sent to a worker.")
+    parser.add_argument('--block-size', type=int, default=256, help="Users scored together inside a worker.")
+    parser.add_argument('--db', default=DB_PATH)
+    args = parser.parse_args()
+
+    stats = run_batch(top_k=args.top_k, workers=args.workers, chunk_size=args.chunk_size,
+                      block_size=args.block_size, db_path=args.db)
+    print(f"Stored {stats['rows']} recommendations for {stats['users']} users with {stats['workers']} worker(s) "
+          f"in {stats['total_seconds']:.2f}s (init {stats['init_seconds']:.2f}s): "
+          f"{stats['users_per_second']:.1f} users/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    """LRU + TTL cache of recommendation lists keyed on (user_id, top_k, model_version).
+
+    Entries are dropped when they expire, when the cache is full (least
+    recently used first), when invalidate_user() is called for their user,
+    or when the model version changes. An optional backend (see
+    SQLiteCacheBackend) is consulted on a miss and written through on put,
+    so cached results survive restarts.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=3600, model_version=None, backend=None, clock=time.time):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_version = model_version
+        self.backend = backend
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._user_keys = {}  # user_id -> set of keys, for invalidate_user
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _key(self, user_id, top_k):
+        return (user_id, top_k, self.model_version)
+
+    def get(self, user_id, top_k):
+        """Cached recommendations for the user, or None."""
+        now = self._clock()
+        with self._lock:
+            key = self._key(user_id, top_k)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(value)
+                self._remove(key)
+                self.expirations += 1
+        if self.backend is not None:
+            stored = self.backend.get(*key, now=now)
+            if stored is not None:
+                value, expires_at = stored
+                with self._lock:
+                    self._insert(key, value, expires_at)
+                    self.hits += 1
+                return list(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, user_id, top_k, value):
+        expires_at = self._clock() + self.ttl_seconds
+        key = self._key(user_id, top_k)
+        with self._lock:
+            self._insert(key, tuple(value), expires_at)
+        if self.backend is not None:
+            self.backend.put(*key, value, expires_at, now=expires_at - self.ttl_seconds)
+
+    def prune(self):
+        """Drop backend entries that expired or belong to another model version, e.g. at startup."""
+        if self.backend is not None:
+            self.backend.prune(_version(self.model_version), self._clock())
+
+    def invalidate_user(self, user_id):
+        """Drop every cached list for a user, e.g. after their history changed."""
+        with self._lock:
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+        if self.backend is not None:
+            self.backend.delete_user(user_id)
+
+    def invalidate_all(self, model_version=None):
+        """Drop everything, e.g. after the product catalog changed. Optionally switch to a new model version."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._user_keys.clear()
+            if model_version is not None:
+                self.model_version = model_version
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def _insert(self, key, value, expires_at):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (value, expires_at)
+        self._user_keys.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest, _ = self._entries.popitem(last=False)
+            self._forget_user_key(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._forget_user_key(key)
+
+    def _forget_user_key(self, key):
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+
+class SQLiteCacheBackend:
+    """Persists RecommendationCache entries in the recommendations database via a RecommendationStore.
+
+    Every prune_every puts, rows that expired or belong to another model
+    version are deleted, and then the rows closest to expiry beyond max_size
+    (None for no cap).
+    """
+
+    def __init__(self, store, max_size=None, prune_every=1000):
+        self.store = store
+        self.max_size = max_size
+        self.prune_every = prune_every
+        self._puts = 0
+        with self.store.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS recommendation_cache
+                            (user_id TEXT, top_k INTEGER, model_version TEXT, product_ids TEXT, expires_at REAL,
+                             PRIMARY KEY (user_id, top_k, model_version))''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendation_cache_expires ON recommendation_cache (expires_at)")
+
+    def get(self, user_id, top_k, model_version, now):
+        row = self.store.connection().execute(
+            "SELECT product_ids, expires_at FROM recommendation_cache WHERE user_id = ? AND top_k = ? AND model_version = ?",
+            (user_id, top_k, _version(model_version))).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return tuple(json.loads(row[0])), row[1]
+
+    def put(self, user_id, top_k, model_version, value, expires_at, now=None):
+        with self.store.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO recommendation_cache VALUES (?, ?, ?, ?, ?)",
+                         (user_id, top_k, _version(model_version), json.dumps(list(value)), expires_at))
+        self._puts += 1
+        if self._puts % self.prune_every == 0:
+            self.prune(_version(model_version), time.time() if now is None else now)
+
+    def prune(self, model_version, now):
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM recommendation_cache WHERE expires_at <= ? OR model_version != ?",
+                         (now, model_version))
+            if self.max_size is not None:
+                excess = conn.execute("SELECT COUNT(*) FROM recommendation_cache").fetchone()[0] - self.max_size
+                if excess > 0:
+                    conn.execute('''DELETE FROM recommendation_cache WHERE rowid IN
+                                    (SELECT rowid FROM recommendation_cache ORDER BY expires_at LIMIT ?)''', (excess,))
+
+    def delete_user(self, user_id):
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM recommendation_cache WHERE user_id = ?", (user_id,))
+
+    def clear(self):
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM recommendation_cache")
+
+
+def _version(model_version):
+    return '' if model_version is None else str(model_version)
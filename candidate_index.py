@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+class CandidateIndex:
+    """Products that pass the rating filter, partitioned by category and sorted by price within each partition.
+
+    candidates() answers "these categories, price in [low, high]" with one
+    binary search per category, so its cost grows with the number of
+    candidates returned rather than with the catalog size. Products with a
+    missing price or rating never qualify, as with the equivalent masks.
+    """
+
+    def __init__(self, categories, prices, ratings, min_rating):
+        self.min_rating = min_rating
+        self.partitions = {}  # category -> (sorted prices, catalog positions)
+        prices = np.asarray(prices, dtype=np.float64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        categories = np.asarray(categories, dtype=object)
+        eligible = np.flatnonzero((ratings >= min_rating) & ~np.isnan(prices))
+        if len(eligible) == 0:
+            return
+        codes, labels = pd.factorize(categories[eligible], use_na_sentinel=False)
+        # Group by category, then price; positions stay ascending among equal prices
+        order = np.lexsort((eligible, prices[eligible], codes))
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for group in np.split(order, bounds):
+            self.partitions[labels[codes[group[0]]]] = (prices[eligible[group]], eligible[group])
+
+    def candidates(self, categories, low, high):
+        """Catalog positions, ascending, of eligible products in any of categories with low <= price <= high."""
+        pieces = []
+        for category in categories:
+            partition = self.partitions.get(category)
+            if partition is None:
+                continue
+            prices, positions = partition
+            start = np.searchsorted(prices, low, side='left')
+            end = np.searchsorted(prices, high, side='right')
+            if end > start:
+                pieces.append(positions[start:end])
+        if not pieces:
+            return np.empty(0, dtype=np.int64)
+        if len(pieces) == 1:
+            return np.sort(pieces[0])
+        return np.sort(np.concatenate(pieces))
+
+    def update(self, position, category, price, rating):
+        """Reflect a changed or added product at catalog position."""
+        for key, (prices, positions) in list(self.partitions.items()):
+            found = np.flatnonzero(positions == position)
+            if len(found):
+                self.partitions[key] = (np.delete(prices, found), np.delete(positions, found))
+                break
+        if not (rating >= self.min_rating) or np.isnan(price):
+            return
+        prices, positions = self.partitions.get(category, (np.empty(0), np.empty(0, dtype=np.int64)))
+        at = np.searchsorted(prices, price, side='right')
+        self.partitions[category] = (np.insert(prices, at, price), np.insert(positions, at, position))
+
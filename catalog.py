@@ -0,0 +1,238 @@
+import ast
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from utils import read_csv_chunks, DEFAULT_CHUNK_SIZE
+from model_bundle import source_checksums
+
+CUSTOMER_LIST_COLS = ['Browsing_History', 'Purchase_History']
+PRODUCT_LIST_COLS = ['Similar_Product_List']
+CUSTOMER_CATEGORICAL_COLS = ['Gender', 'Location', 'Customer_Segment', 'Holiday', 'Season']
+PRODUCT_CATEGORICAL_COLS = ['Category', 'Subcategory', 'Brand', 'Holiday', 'Season', 'Geographical_Location']
+
+# Columns read from the CSVs and their dtypes; anything else (e.g. the trailing unnamed columns) is skipped.
+# Integer columns are left to inference so a missing value does not fail the whole load.
+CUSTOMER_DTYPES = {
+    'Customer_ID': str, 'Age': None, 'Gender': str, 'Location': str, 'Browsing_History': str,
+    'Purchase_History': str, 'Customer_Segment': str, 'Avg_Order_Value': 'float64', 'Holiday': str, 'Season': str,
+    'Username': str,
+}
+PRODUCT_DTYPES = {
+    'Product_ID': str, 'Category': str, 'Subcategory': str, 'Price': None, 'Brand': str,
+    'Average_Rating_of_Similar_Products': 'float64', 'Product_Rating': 'float64',
+    'Customer_Review_Sentiment_Score': 'float64', 'Holiday': str, 'Season': str, 'Geographical_Location': str,
+    'Similar_Product_List': str, 'Probability_of_Recommendation': 'float64',
+}
+
+CATALOG_FORMAT_VERSION = 2
+
+
+class Catalog:
+    """Customer and product tables with the list columns parsed once into integer token codes.
+
+    Every list column is stored as a ragged array: ``offsets`` (n + 1) and
+    ``codes`` into the shared ``item_vocabulary``, so row i holds
+    ``codes[offsets[i]:offsets[i + 1]]``. Product_ID is an int and the
+    low-cardinality text columns are categoricals.
+    """
+
+    def __init__(self, customer_data, product_data, item_vocabulary, lists):
+        self.customer_data = customer_data
+        self.product_data = product_data
+        self.item_vocabulary = np.asarray(item_vocabulary, dtype=str)
+        self.item_codes = {item: i for i, item in enumerate(self.item_vocabulary)}
+        self.lists = lists  # column name -> (offsets, codes)
+        self.customer_ids = customer_data['Customer_ID'].tolist()
+        self.product_ids = product_data['Product_ID'].to_numpy()
+        self.customer_rows = {cid: i for i, cid in enumerate(self.customer_ids)}
+        self.product_rows = {pid: i for i, pid in enumerate(self.product_ids.tolist())}
+        self.product_version = None
+        self.version = None
+
+    @classmethod
+    def from_frames(cls, customer_data, product_data):
+        return cls.from_chunks([customer_data], [product_data])
+
+    @classmethod
+    def from_chunks(cls, customer_chunks, product_chunks):
+        """Build the catalog from iterables of DataFrame chunks, e.g. from utils.read_csv_chunks.
+
+        Each chunk's list columns are encoded and its text columns made
+        categorical before the next chunk is read, so the raw strings of only
+        one chunk are held at a time.
+        """
+        vocabulary = {}
+        frames = {}
+        lists = {}
+        for name, chunks, list_cols, categorical_cols in (
+                ('customer', customer_chunks, CUSTOMER_LIST_COLS, CUSTOMER_CATEGORICAL_COLS),
+                ('product', product_chunks, PRODUCT_LIST_COLS, PRODUCT_CATEGORICAL_COLS)):
+            parts = []
+            encoded = {col: [] for col in list_cols}
+            for chunk in chunks:
+                chunk = _drop_unnamed(chunk)
+                for col in list_cols:
+                    values = chunk[col] if col in chunk.columns else [''] * len(chunk)
+                    rows = [ast.literal_eval(x) if isinstance(x, str) and x else [] for x in values]
+                    for items in rows:
+                        for item in items:
+                            vocabulary.setdefault(item, len(vocabulary))
+                    encoded[col].append(_encode(rows, vocabulary))
+                chunk = chunk.drop(columns=[c for c in list_cols if c in chunk.columns])
+                if name == 'customer':
+                    chunk['Customer_ID'] = chunk['Customer_ID'].astype(str)
+                else:
+                    chunk['Product_ID'] = chunk['Product_ID'].astype(str).str.replace('P', '').astype(np.int64)
+                _to_categorical(chunk, categorical_cols)
+                parts.append(chunk)
+            frames[name] = _concat_chunks(parts, categorical_cols)
+            for col, pieces in encoded.items():
+                lists[col] = _concat_encoded(pieces)
+        return cls(frames['customer'], frames['product'], list(vocabulary), lists)
+
+    def list_column(self, col, row=None, start=0, stop=None):
+        """Decode a list column back to item names, for one row or for every row in [start, stop)."""
+        offsets, codes = self.lists[col]
+        if row is not None:
+            return self.item_vocabulary[codes[offsets[row]:offsets[row + 1]]].tolist()
+        stop = len(offsets) - 1 if stop is None else min(stop, len(offsets) - 1)
+        base = offsets[start]
+        items = self.item_vocabulary[codes[base:offsets[stop]]].tolist()
+        return [items[offsets[i] - base:offsets[i + 1] - base] for i in range(start, stop)]
+
+    def set_list(self, col, row, items):
+        """Replace one row of a list column; items not seen before are added to the vocabulary."""
+        for item in items:
+            if item not in self.item_codes:
+                self.item_codes[item] = len(self.item_vocabulary)
+                self.item_vocabulary = np.append(self.item_vocabulary, item)
+        new_codes = np.array([self.item_codes[item] for item in items], dtype=np.int32)
+        offsets, codes = self.lists[col]
+        start, end = offsets[row], offsets[row + 1]
+        codes = np.concatenate([codes[:start], new_codes, codes[end:]])
+        offsets = offsets.copy()
+        offsets[row + 1:] += len(new_codes) - (end - start)
+        self.lists[col] = (offsets, codes)
+
+    def indicator(self, col):
+        """Boolean (rows x item_vocabulary) matrix: True where the item appears in the row's list."""
+        offsets, codes = self.lists[col]
+        matrix = np.zeros((len(offsets) - 1, len(self.item_vocabulary)), dtype=bool)
+        matrix[np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)), codes] = True
+        return matrix
+
+    def save(self, cache_path, checksums=()):
+        arrays = {
+            'format_version': np.array(CATALOG_FORMAT_VERSION),
+            'sources': np.array(list(checksums), dtype=str),
+            'item_vocabulary': self.item_vocabulary,
+        }
+        for prefix, frame in (('customer', self.customer_data), ('product', self.product_data)):
+            arrays[f'{prefix}/columns'] = np.array(frame.columns, dtype=str)
+            for col in frame.columns:
+                series = frame[col]
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    arrays[f'{prefix}/{col}/codes'] = series.cat.codes.to_numpy()
+                    arrays[f'{prefix}/{col}/categories'] = np.asarray(series.cat.categories, dtype=str)
+                elif pd.api.types.is_numeric_dtype(series.dtype):
+                    arrays[f'{prefix}/{col}'] = series.to_numpy()
+                else:
+                    arrays[f'{prefix}/{col}'] = series.fillna('').to_numpy(dtype=str)
+        for col, (offsets, codes) in self.lists.items():
+            arrays[f'lists/{col}/offsets'] = offsets
+            arrays[f'lists/{col}/codes'] = codes
+        tmp_path = cache_path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls, cache_path, checksums=()):
+        """Load a cached catalog, or return None if it is missing, built from CSVs with other checksums or from another format version."""
+        if not os.path.exists(cache_path):
+            return None
+        with np.load(cache_path, allow_pickle=False) as data:
+            if int(data['format_version']) != CATALOG_FORMAT_VERSION:
+                return None
+            if data['sources'].tolist() != list(checksums):
+                return None
+            frames = {}
+            for prefix in ('customer', 'product'):
+                columns = {}
+                for col in data[f'{prefix}/columns'].tolist():
+                    if f'{prefix}/{col}/codes' in data:
+                        columns[col] = pd.Categorical.from_codes(data[f'{prefix}/{col}/codes'],
+                                                                 data[f'{prefix}/{col}/categories'])
+                    else:
+                        columns[col] = data[f'{prefix}/{col}']
+                frames[prefix] = pd.DataFrame(columns)
+            lists = {}
+            for key in data.files:
+                if key.startswith('lists/') and key.endswith('/offsets'):
+                    col = key[len('lists/'):-len('/offsets')]
+                    lists[col] = (data[key], data[f'lists/{col}/codes'])
+            return cls(frames['customer'], frames['product'], data['item_vocabulary'], lists)
+
+
+def load_catalog(customer_data_path, product_data_path, cache_path=None, chunk_size=DEFAULT_CHUNK_SIZE, checksums=None):
+    """Build the catalog from the CSVs, reusing the binary cache at cache_path while the CSVs are unchanged.
+
+    The cache and the catalog versions are keyed on the SHA-256 checksums of
+    the CSVs, the same ones the model bundle uses (see source_checksums); pass
+    them as checksums if already computed. The CSVs are streamed chunk_size
+    rows at a time, parsing only the known columns with explicit dtypes.
+    """
+    if not (os.path.exists(customer_data_path) and os.path.exists(product_data_path)):
+        raise ValueError(f"Could not load data. Check {customer_data_path} and {product_data_path}.")
+    if checksums is None:
+        checksums = source_checksums(customer_data_path, product_data_path)
+    catalog = Catalog.load(cache_path, checksums) if cache_path is not None else None
+    if catalog is None:
+        catalog = Catalog.from_chunks(read_csv_chunks(customer_data_path, CUSTOMER_DTYPES, chunk_size),
+                                      read_csv_chunks(product_data_path, PRODUCT_DTYPES, chunk_size))
+        if cache_path is not None:
+            catalog.save(cache_path, checksums)
+    # Identifies this version of the source CSVs, e.g. to write the products table only once per version
+    catalog.checksums = list(checksums)
+    catalog.product_version = checksums[1]
+    catalog.version = hashlib.sha1('|'.join(checksums).encode()).hexdigest()[:12]
+    return catalog
+
+
+def _drop_unnamed(frame):
+    return frame.loc[:, ~frame.columns.astype(str).str.startswith('Unnamed')].copy()
+
+
+def _to_categorical(frame, columns):
+    for col in columns:
+        if col in frame.columns:
+            frame[col] = frame[col].fillna('').astype(str).astype('category')
+
+
+def _concat_chunks(parts, categorical_cols):
+    if len(parts) == 1:
+        return parts[0].reset_index(drop=True)
+    frame = pd.concat(parts, ignore_index=True)
+    # Chunks have their own categories; merge them into one sorted set, as astype('category') would
+    for col in categorical_cols:
+        if col in frame.columns:
+            frame[col] = union_categoricals([part[col] for part in parts], sort_categories=True)
+    return frame
+
+
+def _concat_encoded(pieces):
+    """Join per-chunk (offsets, codes) ragged arrays into one."""
+    if len(pieces) == 1:
+        return pieces[0]
+    ends = np.cumsum([offsets[-1] for offsets, _ in pieces])
+    offsets = np.concatenate([pieces[0][0]] + [offsets[1:] + end for (offsets, _), end in zip(pieces[1:], ends)])
+    return offsets, np.concatenate([codes for _, codes in pieces])
+
+
+def _encode(rows, vocabulary):
+    lengths = np.fromiter((len(items) for items in rows), dtype=np.int64, count=len(rows))
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    codes = np.fromiter((vocabulary[item] for items in rows for item in items), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, codes
@@ -0,0 +1,238 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from itertools import chain
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from catalog import load_catalog
+from user_profiling import UserProfilingAgent
+from product_analysis import ProductAnalysisAgent
+from recommendation import RecommendationAgent
+from service import RecommendationService, CUSTOMER_DATA_PATH, PRODUCT_DATA_PATH
+from utils import load_data, evaluate_recommendations, recall_at_k, ndcg_at_k
+
+def generate_synthetic_data(n_customers, n_products, out_dir, customer_data_path=CUSTOMER_DATA_PATH,
+                            product_data_path=PRODUCT_DATA_PATH, seed=0):
+    """Write customer and product CSVs of the requested size by resampling the real rows under fresh IDs.
+
+    Avg_Order_Value and Price are jittered by +/-20% so the price filter does not
+    just select copies of the same rows. Returns (customer_csv, product_csv).
+    """
+    rng = np.random.default_rng(seed)
+    customers = load_data(customer_data_path)
+    products = load_data(product_data_path)
+
+    customers = customers.iloc[rng.integers(0, len(customers), n_customers)].reset_index(drop=True)
+    customers['Customer_ID'] = [f"C{1000 + i}" for i in range(n_customers)]
+    customers['Avg_Order_Value'] = (customers['Avg_Order_Value'] * rng.uniform(0.8, 1.2, n_customers)).round(2)
+
+    products = products.iloc[rng.integers(0, len(products), n_products)].reset_index(drop=True)
+    products['Product_ID'] = [f"P{2000 + i}" for i in range(n_products)]
+    products['Price'] = (products['Price'] * rng.uniform(0.8, 1.2, n_products)).round().astype(int)
+
+    customer_csv = os.path.join(out_dir, 'customers.csv')
+    product_csv = os.path.join(out_dir, 'products.csv')
+    customers.to_csv(customer_csv, index=False)
+    products.to_csv(product_csv, index=False)
+    return customer_csv, product_csv
+
+def split_holdout(customer_data_path, train_path, holdout=0.3):
+    """Hold out the last `holdout` fraction of each customer's Purchase_History.
+
+    Customers with fewer than two purchases keep their full history and are
+    not evaluated. Writes the remaining data to train_path and returns
+    {Customer_ID: held-out items}.
+    """
+    data = load_data(customer_data_path)
+    held_out = {}
+    train_histories = []
+    for customer_id, history in zip(data['Customer_ID'], data['Purchase_History']):
+        items = ast.literal_eval(history) if isinstance(history, str) and history else []
+        n_held_out = min(max(1, round(len(items) * holdout)), len(items) - 1) if len(items) >= 2 else 0
+        if n_held_out:
+            held_out[customer_id] = items[-n_held_out:]
+            items = items[:-n_held_out]
+        train_histories.append(str(items))
+    data['Purchase_History'] = train_histories
+    data.to_csv(train_path, index=False)
+    return held_out
+
+def run_benchmark(customer_data_path=CUSTOMER_DATA_PATH, product_data_path=PRODUCT_DATA_PATH, top_k=5,
+                  holdout=0.3, latency_sample=1000, seed=0):
+    """Build the pipeline on held-out data, then report quality, latency, throughput and per-stage timings."""
+    stages = {}
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        train_path = os.path.join(tmp_dir, 'train.csv')
+        held_out = split_holdout(customer_data_path, train_path, holdout)
+
+        start = time.perf_counter()
+        catalog = load_catalog(train_path, product_data_path)
+        stages['load'] = time.perf_counter() - start
+
+    vectorizer = TfidfVectorizer()
+    user_agent = UserProfilingAgent(catalog, vectorizer)
+    product_agent = ProductAnalysisAgent(catalog, vectorizer)
+    start = time.perf_counter()
+    vectorizer.fit(chain.from_iterable(chain(user_agent.iter_preference_text(), product_agent.iter_feature_text())))
+    stages['vectorize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    user_profiles, user_vector_ids = user_agent.get_unique_user_profiles()
+    product_features, product_vector_ids = product_agent.get_unique_product_features()
+    stages['profile'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rec_agent = RecommendationAgent(user_profiles, product_features, catalog.customer_ids, catalog.product_data,
+                                    catalog.customer_data, catalog=catalog,
+                                    user_vector_ids=user_vector_ids, product_vector_ids=product_vector_ids)
+    stages['score'] = time.perf_counter() - start
+
+    # Single-user latency on a random sample
+    sample = rng.choice(catalog.customer_ids, size=min(latency_sample, len(catalog.customer_ids)), replace=False)
+    latencies = []
+    for user_id in sample:
+        start = time.perf_counter()
+        rec_agent.get_recommendations(user_id, top_k)
+        latencies.append(time.perf_counter() - start)
+
+    # Batch ranking over every evaluated customer, for throughput and quality
+    eval_ids = list(held_out)
+    start = time.perf_counter()
+    recommendations = rec_agent.get_recommendations_batch(eval_ids, top_k)
+    stages['rank'] = time.perf_counter() - start
+
+    # A recommended product is relevant when its Subcategory is one of the held-out purchases
+    subcategories = np.asarray(catalog.product_data['Subcategory'], dtype=object)
+    precision, recall, ndcg = [], [], []
+    for user_id, product_ids in zip(eval_ids, recommendations):
+        predicted = [subcategories[rec_agent.product_rows[pid]] for pid in product_ids]
+        truth = held_out[user_id]
+        precision.append(evaluate_recommendations(truth, predicted, k=top_k))
+        recall.append(recall_at_k(truth, predicted, k=top_k))
+        ndcg.append(ndcg_at_k(truth, predicted, k=top_k))
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'customers': len(catalog.customer_ids),
+        'products': len(catalog.product_ids),
+        'evaluated_users': len(eval_ids),
+        'top_k': top_k,
+        f'precision@{top_k}': float(np.mean(precision)) if precision else 0.0,
+        f'recall@{top_k}': float(np.mean(recall)) if recall else 0.0,
+        f'ndcg@{top_k}': float(np.mean(ndcg)) if ndcg else 0.0,
+        'latency_ms': {f'p{q}': float(np.percentile(latencies_ms, q)) for q in (50, 95, 99)} if len(latencies) else {},
+        'throughput_users_per_sec': len(eval_ids) / stages['rank'] if stages['rank'] > 0 else 0.0,
+        'stage_seconds': stages,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_scaled_benchmark(scale, top_k=5, holdout=0.3, latency_sample=1000, seed=0):
+    """run_benchmark on synthetic data with `scale` customers and `scale` products."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        customer_csv, product_csv = generate_synthetic_data(scale, scale, tmp_dir, seed=seed)
+        return run_benchmark(customer_csv, product_csv, top_k, holdout, latency_sample, seed)
+
+def run_shard_benchmark(shard_counts, customer_data_path=CUSTOMER_DATA_PATH, product_data_path=PRODUCT_DATA_PATH,
+                        top_k=5, latency_sample=1000, seed=0):
+    """Single-user ranking latency and throughput for each shard count, on one service built from the CSVs."""
+    service = RecommendationService(customer_data_path, product_data_path, catalog_cache_path=None, model_bundle_path=None)
+    rec_agent = service.rec_agent
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(service.catalog.customer_ids, size=min(latency_sample, len(service.catalog.customer_ids)),
+                        replace=False).tolist()
+    runs = []
+    for shards in shard_counts:
+        rec_agent.set_shards(shards)
+        rec_agent.get_recommendations(sample[0], top_k)  # start the shard threads
+        latencies = []
+        for user_id in sample:
+            start = time.perf_counter()
+            rec_agent.get_recommendations(user_id, top_k)
+            latencies.append(time.perf_counter() - start)
+        latencies_ms = np.asarray(latencies) * 1000
+        runs.append({
+            'shards': shards,
+            'latency_ms': {f'p{q}': float(np.percentile(latencies_ms, q)) for q in (50, 95, 99)},
+            'throughput_users_per_sec': len(latencies) / sum(latencies),
+        })
+    rec_agent.set_shards(1)
+    return {'customers': len(service.catalog.customer_ids), 'products': len(rec_agent.product_ids),
+            'top_k': top_k, 'cpus': os.cpu_count(), 'runs': runs}
+
+def run_scaled_shard_benchmark(scale, shard_counts, top_k=5, latency_sample=1000, seed=0):
+    """run_shard_benchmark on synthetic data with `scale` products (and as many customers, up to 10000)."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        customer_csv, product_csv = generate_synthetic_data(min(scale, 10000), scale, tmp_dir, seed=seed)
+        return run_shard_benchmark(shard_counts, customer_csv, product_csv, top_k, latency_sample, seed)
+
+def print_shard_report(report):
+    print(f"Customers: {report['customers']}  Products: {report['products']}  CPUs: {report['cpus']}")
+    base = report['runs'][0]['throughput_users_per_sec']
+    for run in report['runs']:
+        latency = run['latency_ms']
+        print(f"Shards {run['shards']:>3}: p50 {latency['p50']:.2f}ms  p95 {latency['p95']:.2f}ms  "
+              f"{run['throughput_users_per_sec']:.1f} users/sec  x{run['throughput_users_per_sec'] / base:.2f}")
+
+def print_report(report):
+    top_k = report['top_k']
+    print(f"Customers: {report['customers']}  Products: {report['products']}  Evaluated users: {report['evaluated_users']}")
+    print(f"precision@{top_k}: {report[f'precision@{top_k}']:.4f}  recall@{top_k}: {report[f'recall@{top_k}']:.4f}  "
+          f"ndcg@{top_k}: {report[f'ndcg@{top_k}']:.4f}")
+    latency = report['latency_ms']
+    if latency:
+        print(f"Latency ms: p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  p99 {latency['p99']:.2f}")
+    print(f"Throughput: {report['throughput_users_per_sec']:.1f} users/sec  Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    print("Stages (s): " + "  ".join(f"{name} {seconds:.3f}" for name, seconds in report['stage_seconds'].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation and benchmark of the recommender.")
+    parser.add_argument('--customers', default=CUSTOMER_DATA_PATH)
+    parser.add_argument('--products', default=PRODUCT_DATA_PATH)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--holdout', type=float, default=0.3, help="Fraction of each Purchase_History held out.")
+    parser.add_argument('--latency-sample', type=int, default=1000, help="Users timed one at a time.")
+    parser.add_argument('--scale', type=int, nargs='+',
+                        help="Run on synthetic data with this many customers and products, e.g. --scale 10000 100000 1000000.")
+    parser.add_argument('--shards', type=int, nargs='+',
+                        help="Instead, benchmark sharded ranking with these shard counts, e.g. --shards 1 2 4 8; "
+                             "with --scale, on that many synthetic products.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the report(s) to this file.")
+    args = parser.parse_args()
+
+    if args.shards:
+        if not args.scale:
+            reports = [run_shard_benchmark(args.shards, args.customers, args.products, args.top_k, args.latency_sample, args.seed)]
+        else:
+            reports = []
+            context = multiprocessing.get_context('spawn')
+            for scale in args.scale:
+                with context.Pool(1) as pool:
+                    reports.append(pool.apply(run_scaled_shard_benchmark,
+                                              (scale, args.shards, args.top_k, args.latency_sample, args.seed)))
+    elif not args.scale:
+        reports = [run_benchmark(args.customers, args.products, args.top_k, args.holdout, args.latency_sample, args.seed)]
+    else:
+        # A fresh process per scale so peak RSS is measured per run
+        reports = []
+        context = multiprocessing.get_context('spawn')
+        for scale in args.scale:
+            with context.Pool(1) as pool:
+                reports.append(pool.apply(run_scaled_benchmark,
+                                          (scale, args.top_k, args.holdout, args.latency_sample, args.seed)))
+    print_one = print_shard_report if args.shards else print_report
+    for report in reports:
+        print_one(report)
+        print("----------------------------------------------------------------")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Stage timers and counters for the recommendation pipeline.
+
+    timer(name) records count / total / max seconds for a stage and count(name)
+    bumps a counter; both are cheap enough for the per-request path. Every
+    finished stage is also passed to the registered hooks, e.g. log_stage.
+    Profiling is opt-in: after enable_profiling() the outermost timed stage in
+    each thread also runs under cProfile, and tracemalloc records its peak
+    allocation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.timers = {}  # name -> [count, total_seconds, max_seconds]
+        self.counters = {}
+        self.hooks = []  # callables (name, seconds)
+        self.profiling = False
+        self.profiles = {}  # name -> pstats.Stats, while profiling
+        self.peak_allocations = {}  # name -> peak traced bytes, while profiling
+
+    @contextmanager
+    def timer(self, name):
+        profiler = self._start_profile() if self.profiling else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                self._stop_profile(name, profiler)
+            self.record(name, seconds)
+
+    def record(self, name, seconds):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def enable_profiling(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.profiling = True
+
+    def disable_profiling(self):
+        self.profiling = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _start_profile(self):
+        # Only one cProfile profiler can run per thread, so nested stages are covered by their parent
+        if getattr(self._local, 'profiling', False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active
+            return None
+        self._local.profiling = True
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        return profiler
+
+    def _stop_profile(self, name, profiler):
+        profiler.disable()
+        self._local.profiling = False
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        with self._lock:
+            if name in self.profiles:
+                self.profiles[name].add(profiler)
+            else:
+                self.profiles[name] = pstats.Stats(profiler)
+            self.peak_allocations[name] = max(self.peak_allocations.get(name, 0), peak)
+
+    def profile_report(self, name, limit=20, sort='cumulative'):
+        """The top functions of a profiled stage, as pstats text."""
+        with self._lock:
+            stats = self.profiles.get(name)
+            if stats is None:
+                return ''
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.profiles.clear()
+            self.peak_allocations.clear()
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                'timers': {
+                    name: {'count': count, 'total_seconds': total, 'mean_seconds': total / count, 'max_seconds': peak}
+                    for name, (count, total, peak) in self.timers.items()
+                },
+                'counters': dict(self.counters),
+                'peak_rss_bytes': peak_rss_bytes(),
+            }
+            if self.peak_allocations:
+                snapshot['peak_allocation_bytes'] = dict(self.peak_allocations)
+        return snapshot
+
+    def log(self, level=logging.INFO):
+        """Emit the snapshot as one JSON log line."""
+        logger.log(level, json.dumps({'metrics': self.snapshot()}))
+
+    def to_prometheus(self, prefix='recommender', gauges=None):
+        """The snapshot in the Prometheus text exposition format, plus any extra {name: value} gauges."""
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {prefix}_stage_seconds summary']
+        for name, timer in sorted(snapshot['timers'].items()):
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {timer["count"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {timer["total_seconds"]:.9f}')
+        lines.append(f'# TYPE {prefix}_stage_seconds_max gauge')
+        for name, timer in sorted(snapshot['timers'].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {timer["max_seconds"]:.9f}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        lines.append(f'# TYPE {prefix}_peak_rss_bytes gauge')
+        lines.append(f'{prefix}_peak_rss_bytes {snapshot["peak_rss_bytes"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def log_stage(name, seconds):
+    """A hook that logs every finished stage as a JSON line: metrics.hooks.append(log_stage)."""
+    logger.info(json.dumps({'stage': name, 'seconds': seconds}))
+
+
+# Shared by every agent and the service
+metrics = Metrics()
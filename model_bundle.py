@@ -0,0 +1,155 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+
+MODEL_FORMAT_VERSION = 1
+
+
+class ModelBundle:
+    """Everything the service derives from the CSVs, persisted so a process can start without refitting.
+
+    A bundle holds the fitted TF-IDF vocabulary and IDF, the distinct user and
+    product vectors with the vector id of every user and product, their
+    distinct x distinct scores and the agent's re-ranking columns. Each array
+    is a plain .npy file in a directory named after the model version, which
+    is derived from the SHA-256 of the source CSVs: a changed CSV means a new
+    version and the old bundle is simply never loaded again. Arrays are
+    memory-mapped copy-on-write, so worker processes share the pages until one
+    of them updates a row.
+    """
+
+    def __init__(self, version, terms, idf, user_profiles, user_vector_ids, product_features, product_vector_ids,
+                 unique_scores, columns):
+        self.version = version
+        self.terms = terms  # vocabulary terms in column order
+        self.idf = idf
+        self.user_profiles = user_profiles
+        self.user_vector_ids = user_vector_ids
+        self.product_features = product_features
+        self.product_vector_ids = product_vector_ids
+        self.unique_scores = unique_scores
+        self.columns = columns  # RecommendationAgent.rerank_columns()
+
+    @classmethod
+    def from_agent(cls, version, vectorizer, rec_agent):
+        terms = np.empty(len(vectorizer.vocabulary_), dtype=object)
+        for term, column in vectorizer.vocabulary_.items():
+            terms[column] = term
+        return cls(version, terms.astype(str), vectorizer.idf_, rec_agent.user_profiles, rec_agent.user_vector_ids,
+                   rec_agent.product_features, rec_agent.product_vector_ids, rec_agent.unique_scores,
+                   rec_agent.rerank_columns())
+
+    def restore_vectorizer(self, vectorizer):
+        """Make an unfitted TfidfVectorizer (with the default settings the service uses) fitted to this bundle."""
+        vectorizer.vocabulary_ = {term: column for column, term in enumerate(self.terms.tolist())}
+        vectorizer.idf_ = np.asarray(self.idf)
+        return vectorizer
+
+    def save(self, bundle_dir, checksums):
+        """Write the bundle under bundle_dir/<version>/ and remove older versions.
+
+        The files are written to a temporary directory that is renamed into
+        place, so a concurrent reader never sees a partial bundle.
+        """
+        os.makedirs(bundle_dir, exist_ok=True)
+        arrays = {'terms': self.terms, 'idf': self.idf,
+                  'user_vector_ids': self.user_vector_ids, 'product_vector_ids': self.product_vector_ids}
+        for prefix, matrix in (('user_profiles', self.user_profiles), ('product_features', self.product_features)):
+            arrays[f'{prefix}.data'] = matrix.data
+            arrays[f'{prefix}.indices'] = matrix.indices
+            arrays[f'{prefix}.indptr'] = matrix.indptr
+        if self.unique_scores is not None:
+            arrays['unique_scores'] = self.unique_scores
+        for name, column in self.columns.items():
+            if column is not None:
+                arrays[f'columns.{name}'] = column
+        manifest = {
+            'format_version': MODEL_FORMAT_VERSION,
+            'version': self.version,
+            'checksums': checksums,
+            'user_profiles_shape': list(self.user_profiles.shape),
+            'product_features_shape': list(self.product_features.shape),
+            'columns': sorted(self.columns),
+            'arrays': sorted(arrays),
+        }
+
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=bundle_dir)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, name + '.npy'), np.asarray(array), allow_pickle=False)
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(tmp_dir, os.path.join(bundle_dir, self.version))
+            except OSError:
+                # Another process already wrote this version
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        # Processes that still map an old version keep their pages until they exit
+        for name in os.listdir(bundle_dir):
+            if name != self.version and not name.startswith('.tmp-'):
+                shutil.rmtree(os.path.join(bundle_dir, name), ignore_errors=True)
+
+    @classmethod
+    def load(cls, bundle_dir, checksums, mmap_mode='c'):
+        """Load the bundle for these source checksums, or return None if there is none or it is incompatible."""
+        version = model_version(checksums)
+        path = os.path.join(bundle_dir, version)
+        try:
+            with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format_version') != MODEL_FORMAT_VERSION or manifest.get('checksums') != checksums:
+            return None
+
+        def array(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+        def matrix(prefix):
+            return sp.csr_matrix((array(f'{prefix}.data'), array(f'{prefix}.indices'), array(f'{prefix}.indptr')),
+                                 shape=tuple(manifest[f'{prefix}_shape']), copy=False)
+
+        arrays = set(manifest['arrays'])
+        columns = {name: array(f'columns.{name}') if f'columns.{name}' in arrays else None
+                   for name in manifest['columns']}
+        return cls(version, np.load(os.path.join(path, 'terms.npy'), allow_pickle=False), array('idf'),
+                   matrix('user_profiles'), array('user_vector_ids'), matrix('product_features'),
+                   array('product_vector_ids'), array('unique_scores') if 'unique_scores' in arrays else None, columns)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_checksums(*paths):
+    return [file_checksum(path) for path in paths]
+
+def model_version(checksums):
+    return hashlib.sha1(f"{MODEL_FORMAT_VERSION}|{'|'.join(checksums)}".encode()).hexdigest()[:12]
+
+def main():
+    from service import RecommendationService, CUSTOMER_DATA_PATH, PRODUCT_DATA_PATH, CATALOG_CACHE_PATH, MODEL_BUNDLE_PATH
+
+    parser = argparse.ArgumentParser(description="Build the model bundle the service and batch jobs start from.")
+    parser.add_argument('--customers', default=CUSTOMER_DATA_PATH)
+    parser.add_argument('--products', default=PRODUCT_DATA_PATH)
+    parser.add_argument('--out', default=MODEL_BUNDLE_PATH)
+    args = parser.parse_args()
+
+    # The service writes the bundle whenever the one for the current CSVs is missing
+    service = RecommendationService(args.customers, args.products, CATALOG_CACHE_PATH, model_bundle_path=args.out)
+    print(f"Model bundle {service.model_version} in {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+from collections import Counter
+import pandas as pd
+
+DB_PATH = 'ecommerce_recommendations.db'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users
+       (user_id TEXT PRIMARY KEY, preferences TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS products
+       (product_id INTEGER PRIMARY KEY, details TEXT, price REAL, rating REAL)''',
+    '''CREATE TABLE IF NOT EXISTS recommendations
+       (user_id TEXT, product_id INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, run_id INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        FOREIGN KEY (product_id) REFERENCES products(product_id))''',
+    # One row per save_recommendations call; a user's rows from one call are one run. served marks
+    # runs shown to users, as opposed to lists precomputed by batch jobs
+    '''CREATE TABLE IF NOT EXISTS recommendation_runs
+       (run_id INTEGER PRIMARY KEY AUTOINCREMENT, created_at DATETIME NOT NULL, served INTEGER NOT NULL DEFAULT 0)''',
+    # Rollups of the recommendations shown to users, maintained by record_exposures
+    '''CREATE TABLE IF NOT EXISTS recommendation_exposures
+       (user_id TEXT, product_id INTEGER, times_shown INTEGER NOT NULL, first_shown DATETIME, last_shown DATETIME,
+        PRIMARY KEY (user_id, product_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS recommendation_daily_counts
+       (day DATE, product_id INTEGER, times_shown INTEGER NOT NULL,
+        PRIMARY KEY (day, product_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS metadata
+       (key TEXT PRIMARY KEY, value TEXT)''',
+]
+
+# Columns added after the first release, for databases created before them: table -> {column: type}
+ADDED_COLUMNS = {'recommendations': {'run_id': 'INTEGER'},
+                 'recommendation_runs': {'served': 'INTEGER NOT NULL DEFAULT 0'}}
+
+# Created once the ADDED_COLUMNS exist
+INDEXES = [
+    '''CREATE INDEX IF NOT EXISTS idx_recommendations_user_run
+       ON recommendations (user_id, run_id)''',
+    # Replaced by idx_recommendations_user_run
+    "DROP INDEX IF EXISTS idx_recommendations_user_timestamp",
+]
+
+
+class RecommendationStore:
+    """SQLite persistence for users, the product catalog and recommendation history.
+
+    Keeps one connection per thread (sqlite3 connections are not shareable
+    across threads) and per process, in WAL mode so readers do not block the
+    writer. Every write method runs in a single transaction.
+
+    The recommendations history is kept indefinitely. The analytics queries
+    never scan it: per-user exposures and per-day product counts are rollup
+    tables keyed for their lookups, updated with every list shown to a user
+    (record_exposures).
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                _add_missing_columns(conn)
+                for statement in INDEXES:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get_metadata(self, key):
+        row = self.connection().execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def save_users(self, rows):
+        """Upsert (user_id, preferences) rows."""
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO users (user_id, preferences) VALUES (?, ?)", rows)
+
+    def save_user(self, user_id, preferences):
+        self.save_users([(user_id, preferences)])
+
+    def upsert_products(self, product_data, version=None):
+        """Upsert the whole product catalog in one transaction.
+
+        When version is given it is recorded in the metadata table and a later
+        call with the same version is a no-op, so the catalog is written once
+        rather than per request.
+        """
+        if version is not None and self.get_metadata('products_version') == version:
+            return False
+        product_ids = product_data['Product_ID'].astype(str).str.replace('P', '').astype(int).tolist()
+        details = (product_data['Brand'].astype(str) + ' ' + product_data['Subcategory'].astype(str)
+                   + ' in ' + product_data['Category'].astype(str)).tolist()
+        prices = _nullable_floats(product_data['Price'])
+        ratings = _nullable_floats(product_data['Product_Rating'])
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO products (product_id, details, price, rating) VALUES (?, ?, ?, ?)",
+                             zip(product_ids, details, prices, ratings))
+            if version is not None:
+                conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('products_version', ?)", (version,))
+        return True
+
+    def save_recommendations(self, rows, served=False):
+        """Append (user_id, product_id) rows, in rank order per user.
+
+        served marks the run as computed for users being served rather than
+        precomputed, e.g. by batch_recommend. Either way this is history only:
+        showing a list is recorded by record_exposures, once per time it is shown.
+
+        All rows get one run id, so each user's rows form one run for get_last_recommendations,
+        even when two saves for that user land in the same second.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        with self.connection() as conn:
+            now = conn.execute("SELECT datetime('now')").fetchone()[0]
+            run_id = conn.execute("INSERT INTO recommendation_runs (created_at, served) VALUES (?, ?)",
+                                  (now, int(served))).lastrowid
+            conn.executemany("INSERT INTO recommendations (user_id, product_id, timestamp, run_id) VALUES (?, ?, ?, ?)",
+                             [(user_id, product_id, now, run_id) for user_id, product_id in rows])
+
+    def record_exposure_rows(self, rows):
+        """Count (user_id, product_id) rows as shown now, in the exposure and daily rollups, in one transaction."""
+        rows = list(rows)
+        if not rows:
+            return
+        with self.connection() as conn:
+            now, day = conn.execute("SELECT datetime('now'), date('now')").fetchone()
+            exposures = Counter(rows)
+            daily_counts = Counter(product_id for _, product_id in rows)
+            conn.executemany(
+                '''INSERT INTO recommendation_exposures (user_id, product_id, times_shown, first_shown, last_shown)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, product_id) DO UPDATE
+                   SET times_shown = times_shown + excluded.times_shown, last_shown = excluded.last_shown''',
+                [(user_id, product_id, n, now, now) for (user_id, product_id), n in exposures.items()])
+            conn.executemany(
+                '''INSERT INTO recommendation_daily_counts (day, product_id, times_shown) VALUES (?, ?, ?)
+                   ON CONFLICT (day, product_id) DO UPDATE SET times_shown = times_shown + excluded.times_shown''',
+                [(day, product_id, n) for product_id, n in daily_counts.items()])
+
+    def record_exposures(self, user_id, product_ids):
+        """Record that product_ids were shown to user_id, whether they were just computed, stored or cached."""
+        self.record_exposure_rows([(user_id, product_id) for product_id in product_ids])
+
+    def get_last_recommendations(self, user_id, max_age_seconds=None):
+        """Product ids from the user's most recent recommendation run, in rank order.
+
+        Returns [] when there is none, or when it is older than max_age_seconds.
+        Served from idx_recommendations_user_run without a table scan.
+        """
+        query = '''SELECT product_id FROM recommendations
+                   WHERE user_id = ? AND run_id = (SELECT MAX(run_id) FROM recommendations WHERE user_id = ?)'''
+        params = [user_id, user_id]
+        if max_age_seconds is not None:
+            query += " AND timestamp >= datetime('now', ?)"
+            params.append(f'-{int(max_age_seconds)} seconds')
+        rows = self.connection().execute(query + " ORDER BY rowid", params).fetchall()
+        return [row[0] for row in rows]
+
+    def get_recent_exposures(self, user_id, max_age_seconds, min_age_seconds=None):
+        """Product ids last shown to the user within max_age_seconds, but not within min_age_seconds.
+
+        One primary-key range of recommendation_exposures: O(log n) in the
+        size of the history plus the number of products the user has seen.
+        """
+        query = "SELECT product_id FROM recommendation_exposures WHERE user_id = ? AND last_shown >= datetime('now', ?)"
+        params = [user_id, f'-{int(max_age_seconds)} seconds']
+        if min_age_seconds:
+            query += " AND last_shown < datetime('now', ?)"
+            params.append(f'-{int(min_age_seconds)} seconds')
+        return [row[0] for row in self.connection().execute(query, params).fetchall()]
+
+    def get_exposure_counts(self, user_id):
+        """{product_id: times shown} over the user's whole history."""
+        rows = self.connection().execute(
+            "SELECT product_id, times_shown FROM recommendation_exposures WHERE user_id = ?", (user_id,)).fetchall()
+        return dict(rows)
+
+    def get_top_products(self, day=None, limit=10):
+        """[(product_id, times shown)] for the most shown products on day ('YYYY-MM-DD', UTC; default today)."""
+        rows = self.connection().execute(
+            '''SELECT product_id, times_shown FROM recommendation_daily_counts
+               WHERE day = COALESCE(?, date('now')) ORDER BY times_shown DESC, product_id LIMIT ?''',
+            (day, limit)).fetchall()
+        return [tuple(row) for row in rows]
+
+
+def _add_missing_columns(conn):
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError as e:
+                    # Another process added it first
+                    if 'duplicate column' not in str(e):
+                        raise
+
+def _nullable_floats(series):
+    values = pd.to_numeric(series, errors='coerce')
+    return [None if pd.isna(v) else float(v) for v in values]
@@ -1,34 +1,102 @@
 import pandas as pd
+import scipy.sparse as sp
 from sklearn.metrics.pairwise import cosine_similarity
-from utils import load_data
+from catalog import Catalog, PRODUCT_DTYPES
+from similarity_index import SimilarProductIndex
+from utils import load_data, unique_rows_chunked, set_row, append_row, DEFAULT_CHUNK_SIZE
 
 class ProductAnalysisAgent:
-    def __init__(self, product_data_path, vectorizer):
-        self.product_data = load_data(product_data_path)
+    def __init__(self, product_data, vectorizer, chunk_size=DEFAULT_CHUNK_SIZE):
+        # product_data is a CSV path, an already-loaded DataFrame or a shared Catalog, so the CSV is parsed once
+        if isinstance(product_data, Catalog):
+            product_data = product_data.product_data
+        elif not isinstance(product_data, pd.DataFrame):
+            product_data = load_data(product_data, PRODUCT_DTYPES)
+        self.product_data = product_data
         if self.product_data is None:
             raise ValueError("Product data could not be loaded.")
         self.vectorizer = vectorizer
+        self.chunk_size = chunk_size
+        self.product_rows = {_product_id(pid): i for i, pid in enumerate(self.product_data['Product_ID'])}
 
-    def generate_feature_vectors(self):
+    def generate_feature_text(self, start=0, stop=None):
+        """Feature text of the products in rows [start, stop)."""
         if 'Category' not in self.product_data.columns or 'Subcategory' not in self.product_data.columns or 'Brand' not in self.product_data.columns:
             raise KeyError("Columns 'Category', 'Subcategory', and 'Brand' not found in product data.")
-        feature_data = self.product_data['Category'].fillna('') + ' ' + \
-                       self.product_data['Subcategory'].fillna('') + ' ' + \
-                       self.product_data['Brand'].fillna('')
-        feature_vectors = self.vectorizer.transform(feature_data)  # Use pre-fitted vectorizer
+        product_data = self.product_data.iloc[start:stop]
+        feature_data = _text(product_data['Category']) + ' ' + \
+                       _text(product_data['Subcategory']) + ' ' + \
+                       _text(product_data['Brand'])
+        return feature_data
+
+    def iter_feature_text(self):
+        """generate_feature_text() in chunks of chunk_size products."""
+        n_rows = len(self.product_data)
+        for start in range(0, max(n_rows, 1), self.chunk_size):
+            yield self.generate_feature_text(start, start + self.chunk_size)
+
+    def iter_feature_vectors(self):
+        for text in self.iter_feature_text():
+            yield self.vectorizer.transform(text)  # Use pre-fitted vectorizer
+
+    def generate_feature_vectors(self):
+        # Transformed chunk by chunk, so only one chunk's token lists exist at a time
+        feature_vectors = sp.vstack(list(self.iter_feature_vectors()), format='csr')
         return feature_vectors
 
+    def upsert_product(self, product):
+        """Add a product, or replace the one with the same Product_ID, and return (row, feature row).
+
+        product is a dict of product CSV columns. Only this product is
+        transformed, with the already-fitted vectorizer.
+        """
+        product_id = _product_id(product['Product_ID'])
+        record = {col: product[col] for col in self.product_data.columns if col in product}
+        # A catalog stores Product_ID as an int, the CSV as 'P<id>'
+        numeric_ids = pd.api.types.is_integer_dtype(self.product_data['Product_ID'].dtype)
+        record['Product_ID'] = product_id if numeric_ids else f"P{product_id}"
+        row = self.product_rows.get(product_id)
+        if row is None:
+            row = len(self.product_data)
+            self.product_data = append_row(self.product_data, record)
+            self.product_rows[product_id] = row
+        else:
+            set_row(self.product_data, row, record)
+        return row, self.vectorizer.transform(self.generate_feature_text(row, row + 1)).tocsr()
+
     def compute_similarity_matrix(self):
+        # Dense N x N; prefer build_similarity_index for anything but small catalogs
         feature_vectors = self.generate_feature_vectors()
         similarity_matrix = cosine_similarity(feature_vectors)
         return similarity_matrix
 
-    def get_product_features(self):
+    def build_similarity_index(self, k=10, block_size=1024):
+        """Top-k similar products per product, in memory proportional to N * k."""
+        product_ids = [_product_id(pid) for pid in self.product_data['Product_ID']]
+        return SimilarProductIndex.build(self.generate_feature_vectors(), product_ids, k=k, block_size=block_size)
+
+    def get_unique_product_features(self):
+        """Distinct product vectors and the vector id of every product, so identical vectors are stored and scored once."""
+        unique, vector_ids, _ = unique_rows_chunked(self.iter_feature_vectors())
+        return unique, vector_ids
+
+    def get_product_features(self, sparse=False):
         feature_vectors = self.generate_feature_vectors()
+        if sparse:
+            return feature_vectors.tocsr()
         product_features = pd.DataFrame(feature_vectors.toarray(), 
                                       index=self.product_data['Product_ID'])
         return product_features
 
+def _product_id(product_id):
+    return int(str(product_id).replace('P', ''))
+
+def _text(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Catalog categoricals already hold '' for missing values
+        return column.astype(str)
+    return column.fillna('')
+
 if __name__ == "__main__":
     from sklearn.feature_extraction.text import TfidfVectorizer
     vectorizer = TfidfVectorizer()
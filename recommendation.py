@@ -1,73 +1,449 @@
 import numpy as np
-from collections import Counter
+import pandas as pd
+import scipy.sparse as sp
 import ast 
+import logging
+from utils import row_key, unique_rows, set_row, append_row, rank_in_group, without
+from metrics import metrics
+from candidate_index import CandidateIndex
+from sharded_scoring import ShardedRanker
+
+logger = logging.getLogger(__name__)
+
+# Default candidate filters: these categories, price within PRICE_WINDOW of the customer's
+# Avg_Order_Value, and at least MIN_RATING
+ALLOWED_CATEGORIES = ('Books', 'Fitness', 'Fashion')  # From Browsing_History and Purchase_History
+PRICE_WINDOW = 500
+MIN_RATING = 3.5
+
+# Numeric per-product/per-customer columns that can be restored from a model bundle instead of recomputed
+RERANK_COLUMNS = ('product_ids', 'prices', 'ratings', 'probability_weight', 'similar_rating_weight',
+                  'similar_items', 'purchased_items', 'avg_order_values')
 
 
 class RecommendationAgent:
-    def __init__(self, user_profiles, product_features, customer_ids, product_data, customer_data):
-        self.user_profiles = user_profiles
-        self.product_features = product_features
+    def __init__(self, user_profiles, product_features, customer_ids, product_data, customer_data, lazy=None, catalog=None,
+                 user_vector_ids=None, product_vector_ids=None, max_score_cells=20_000_000, unique_scores=None,
+                 columns=None, allowed_categories=ALLOWED_CATEGORIES, price_window=PRICE_WINDOW, min_rating=MIN_RATING,
+                 shards=1):
+        # Lazy mode keeps the TF-IDF vectors sparse and scores users on demand
+        # instead of materializing the full user x product matrix up front.
+        if lazy is None:
+            lazy = sp.issparse(user_profiles) or sp.issparse(product_features)
+        self.lazy = lazy
+        self.max_score_cells = max_score_cells
+        self.set_vectors(user_profiles, product_features, user_vector_ids, product_vector_ids, unique_scores)
         self.customer_ids = customer_ids
+        self.user_index = {cid: i for i, cid in enumerate(customer_ids)}
         self.product_data = product_data
         self.customer_data = customer_data  # Add customer data for dynamic filtering
-        self.scores = np.dot(user_profiles, product_features.T)
+        self.catalog = catalog
+        self.allowed_categories = list(allowed_categories)
+        self.price_window = price_window
+        self.min_rating = min_rating
+        self._prepare_columns(columns)
+        self.candidate_index = CandidateIndex(self.categories, self.prices, self.ratings, min_rating)
+        self.sharded = None
+        self.set_shards(shards)
+
+    def set_shards(self, shards):
+        """Rank over this many catalog shards in parallel (see ShardedRanker); 1 ranks in the calling thread."""
+        if self.sharded is not None:
+            self.sharded.close()
+        self.sharded = ShardedRanker(self, shards) if shards > 1 else None
+
+    def set_vectors(self, user_profiles, product_features, user_vector_ids=None, product_vector_ids=None,
+                    unique_scores=None):
+        """Swap in new profile and feature matrices, e.g. after a full vectorizer refit.
+
+        In lazy mode user_profiles/product_features may be tables of distinct
+        vectors with user_vector_ids/product_vector_ids mapping every user and
+        product to a row; plain per-entity matrices are deduplicated here.
+        Either way only the distinct vectors are kept and scored. unique_scores,
+        their precomputed product (e.g. from a model bundle), skips the scoring.
+        """
+        if self.lazy:
+            if user_vector_ids is None:
+                user_profiles, user_vector_ids, _ = unique_rows(_to_csr(user_profiles))
+            if product_vector_ids is None:
+                product_features, product_vector_ids, _ = unique_rows(_to_csr(product_features))
+            self.user_profiles = _to_csr(user_profiles)
+            self.product_features = _to_csr(product_features)
+            self.user_vector_ids = np.asarray(user_vector_ids, dtype=np.int64)
+            self.product_vector_ids = np.asarray(product_vector_ids, dtype=np.int64)
+            self.user_vector_keys = {row_key(self.user_profiles, v): v for v in range(self.user_profiles.shape[0])}
+            self.product_vector_keys = {row_key(self.product_features, v): v for v in range(self.product_features.shape[0])}
+            # Distinct user x distinct product scores, when small enough to keep
+            self.unique_scores = unique_scores
+            if unique_scores is None and self.user_profiles.shape[0] * self.product_features.shape[0] <= self.max_score_cells:
+                self.unique_scores = (self.user_profiles @ self.product_features.T).toarray()
+            self.scores = None
+        else:
+            self.user_profiles = _to_dense(user_profiles)
+            self.product_features = _to_dense(product_features)
+            self.scores = np.dot(self.user_profiles, self.product_features.T)
+
+    def _prepare_columns(self, columns=None):
+        """Precompute the per-product and per-customer columns used by the filters and re-ranking.
+
+        These are private writable copies, so upsert_product can update them in place.
+        columns, the RERANK_COLUMNS of a model bundle (which needs a catalog),
+        replaces the numeric ones; copy-on-write memory maps are writable too.
+        """
+        product_data = self.product_data
+        catalog = self.catalog
+        self.categories = np.array(product_data['Category'], dtype=object)
+        self.brand_codes, self.brands = pd.factorize(product_data['Brand'])
+        if columns is not None:
+            if catalog is None:
+                raise ValueError("Restoring re-ranking columns requires a catalog.")
+            for name in RERANK_COLUMNS:
+                setattr(self, name, columns[name])
+            self.item_vocabulary = dict(catalog.item_codes)
+            self.product_rows = {pid: i for i, pid in enumerate(self.product_ids.tolist())}
+            self.customer_rows = {cid: i for i, cid in enumerate(self.customer_data['Customer_ID'])}
+            return
+
+        if catalog is not None:
+            self.product_ids = catalog.product_ids.copy()
+        else:
+            self.product_ids = product_data['Product_ID'].astype(str).str.replace('P', '').astype(int).to_numpy(copy=True)
+        self.prices = pd.to_numeric(product_data['Price'], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+        self.ratings = pd.to_numeric(product_data['Product_Rating'], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+        # The constant parts of the weighted score, kept separate so the sum is evaluated in the original order
+        self.probability_weight = product_data['Probability_of_Recommendation'].astype(float).to_numpy() * 0.5
+        self.similar_rating_weight = product_data['Average_Rating_of_Similar_Products'].astype(float).to_numpy() * 0.1
+
+        if catalog is not None:
+            # The catalog has already parsed the lists into a shared item vocabulary
+            self.item_vocabulary = dict(catalog.item_codes)
+            self.similar_items = catalog.indicator('Similar_Product_List')
+            self.purchased_items = catalog.indicator('Purchase_History')
+        else:
+            # Similar_Product_List as a product x item indicator matrix, parsed once
+            similar_lists = [_parse_list(value) for value in product_data['Similar_Product_List']]
+            self.item_vocabulary = {}
+            for items in similar_lists:
+                for item in items:
+                    self.item_vocabulary.setdefault(item, len(self.item_vocabulary))
+            self.similar_items = np.zeros((len(similar_lists), len(self.item_vocabulary)), dtype=bool)
+            for i, items in enumerate(similar_lists):
+                self.similar_items[i, [self.item_vocabulary[item] for item in items]] = True
+            self.purchased_items = None
+
+        self.product_rows = {pid: i for i, pid in enumerate(self.product_ids.tolist())}
+        self.customer_rows = {cid: i for i, cid in enumerate(self.customer_data['Customer_ID'])}
+        self.avg_order_values = pd.to_numeric(self.customer_data['Avg_Order_Value'], errors='coerce').to_numpy(dtype=np.float64)
+
+    def rerank_columns(self):
+        """The RERANK_COLUMNS arrays, e.g. to store in a model bundle."""
+        return {name: getattr(self, name) for name in RERANK_COLUMNS}
+
+    def purchase_vector(self, purchase_history):
+        """Indicator vector over item_vocabulary for a customer's purchase history."""
+        vector = np.zeros(len(self.item_vocabulary), dtype=bool)
+        for item in _parse_list(purchase_history):
+            code = self.item_vocabulary.get(item)
+            if code is not None:
+                vector[code] = True
+        return vector
+
+    def customer_purchase_vector(self, customer_row):
+        if self.purchased_items is not None:
+            return self.purchased_items[customer_row]
+        return self.purchase_vector(self.customer_data['Purchase_History'].iloc[customer_row])
 
-    def get_recommendations(self, user_id, top_k):
-        if user_id not in self.customer_ids:
+    def update_user(self, user_id, profile_row, purchase_history):
+        """Replace one user's profile vector and purchase history in place."""
+        if user_id not in self.user_index:
             raise ValueError(f"User ID {user_id} not found in customer IDs.")
-        
-        user_index = self.customer_ids.index(user_id)
-        user_scores = self.scores[user_index]
-        
-        # Dynamic filters based on user data
-        user_details = self.customer_data[self.customer_data['Customer_ID'] == user_id].iloc[0]
-        allowed_categories = ['Books', 'Fitness', 'Fashion']  # From Browsing_History and Purchase_History
-        min_price = float(user_details['Avg_Order_Value']) - 500
-        max_price = float(user_details['Avg_Order_Value']) + 500
-        purchase_history = user_details['Purchase_History']
-
-        # Filter products
-        category_mask = self.product_data['Category'].isin(allowed_categories)
-        price_mask = self.product_data['Price'].between(min_price, max_price)
-        rating_mask = self.product_data['Product_Rating'] >= 3.5
-        valid_indices = self.product_data.index[category_mask & price_mask & rating_mask].tolist()
-
-        if not valid_indices:
-            print(f"Warning: No valid recommendations found for {user_id}. Using top scores without strict filters.")
-            recommended_indices = np.argsort(user_scores)[::-1][:top_k]
+        user_index = self.user_index[user_id]
+        if self.scores is not None:
+            profile_row = _to_dense(profile_row).ravel()
+            self.user_profiles[user_index] = profile_row
+            self.scores[user_index] = self.product_features @ profile_row
+        else:
+            self.user_vector_ids[user_index] = self._user_vector_id(profile_row)
+
+        customer_row = self.customer_rows[user_id]
+        if self.purchased_items is not None:
+            self.purchased_items[customer_row] = self.purchase_vector(purchase_history)
         else:
-            # Compute weighted scores
-            valid_scores = []
-            brand_counts = Counter()
-            for i in valid_indices:
-                if i < len(user_scores):
-                    base_score = user_scores[i]
-                    product = self.product_data.iloc[i]
-                    # Boost score for Purchase_History matches in Similar_Product_List
-                    boost = 0.5 if any(item in purchase_history for item in ast.literal_eval(product['Similar_Product_List'])) else 0
-                    # Incorporate Probability_of_Recommendation and Average_Rating_of_Similar_Products
-                    weighted_score = base_score * (1 + boost + float(product['Probability_of_Recommendation']) * 0.5 + float(product['Average_Rating_of_Similar_Products']) * 0.1)
-                    brand = product['Brand']
-                    if brand_counts[brand] < 2:  # Limit to 2 per brand
-                        valid_scores.append((weighted_score, i, brand))
-                        brand_counts[brand] += 1
-
-            if not valid_scores:
-                print(f"Warning: No valid recommendations after diversity filter for {user_id}. Using top scores.")
-                recommended_indices = np.argsort(user_scores)[::-1][:top_k]
+            self.customer_data.iloc[customer_row, self.customer_data.columns.get_loc('Purchase_History')] = str(list(purchase_history))
+
+    def upsert_product(self, product, feature_row):
+        """Add a product, or replace the one with the same Product_ID, without touching any other product.
+
+        product is a dict of product columns. Similar_Product_List items outside
+        item_vocabulary are ignored until the agent is rebuilt.
+        """
+        product_id = int(str(product['Product_ID']).replace('P', ''))
+        record = {col: product[col] for col in self.product_data.columns if col in product}
+        record['Product_ID'] = product_id if self.catalog is not None else f"P{product_id}"
+        brand = product['Brand']
+        if brand not in self.brands:
+            self.brands = self.brands.append(pd.Index([brand]))
+        values = {
+            'product_ids': product_id,
+            'categories': product['Category'],
+            'prices': pd.to_numeric(product['Price'], errors='coerce'),
+            'ratings': pd.to_numeric(product['Product_Rating'], errors='coerce'),
+            'brand_codes': self.brands.get_loc(brand),
+            'probability_weight': float(product['Probability_of_Recommendation']) * 0.5,
+            'similar_rating_weight': float(product['Average_Rating_of_Similar_Products']) * 0.1,
+            'similar_items': self.purchase_vector(product.get('Similar_Product_List', [])),
+        }
+
+        position = self.product_rows.get(product_id)
+        if position is None:
+            position = len(self.product_ids)
+            for name, value in values.items():
+                column = getattr(self, name)
+                setattr(self, name, np.concatenate([column, np.asarray([value], dtype=column.dtype)]))
+            self.product_data = append_row(self.product_data, record)
+            self.product_rows[product_id] = position
+            if self.scores is not None:
+                feature_row = _to_dense(feature_row).ravel()
+                self.product_features = np.vstack([self.product_features, feature_row])
+                self.scores = np.column_stack([self.scores, self.user_profiles @ feature_row])
             else:
-                valid_scores.sort(reverse=True)
-                recommended_indices = [score[1] for score in valid_scores[:top_k]]
+                self.product_vector_ids = np.append(self.product_vector_ids, self._product_vector_id(feature_row))
+        else:
+            for name, value in values.items():
+                getattr(self, name)[position] = value
+            set_row(self.product_data, position, record)
+            if self.scores is not None:
+                feature_row = _to_dense(feature_row).ravel()
+                self.product_features[position] = feature_row
+                self.scores[:, position] = self.user_profiles @ feature_row
+            else:
+                self.product_vector_ids[position] = self._product_vector_id(feature_row)
+        self.candidate_index.update(position, values['categories'], values['prices'], values['ratings'])
+        if self.sharded is not None:
+            self.sharded.update(position, values['categories'], values['prices'], values['ratings'])
+        return position
+
+    def _user_vector_id(self, profile_row):
+        """Id of this profile in the distinct user table, adding it (and its scores) if new."""
+        row = _canonical_row(profile_row)
+        key = row_key(row, 0)
+        if key not in self.user_vector_keys:
+            self.user_vector_keys[key] = self.user_profiles.shape[0]
+            self.user_profiles = sp.vstack([self.user_profiles, row], format='csr')
+            if self.unique_scores is not None:
+                self.unique_scores = np.vstack([self.unique_scores, (row @ self.product_features.T).toarray()])
+        return self.user_vector_keys[key]
+
+    def _product_vector_id(self, feature_row):
+        """Id of this feature vector in the distinct product table, adding it (and its scores) if new."""
+        row = _canonical_row(feature_row)
+        key = row_key(row, 0)
+        if key not in self.product_vector_keys:
+            self.product_vector_keys[key] = self.product_features.shape[0]
+            self.product_features = sp.vstack([self.product_features, row], format='csr')
+            if self.unique_scores is not None:
+                self.unique_scores = np.column_stack([self.unique_scores, (self.user_profiles @ row.T).toarray()])
+        return self.product_vector_keys[key]
+
+    def score_users(self, user_indices):
+        """Return a dense (len(user_indices), n_products) score block."""
+        if self.scores is not None:
+            return self.scores[user_indices]
+        vector_ids = self.user_vector_ids[user_indices]
+        if self.unique_scores is not None:
+            block = self.unique_scores[vector_ids]
+        else:
+            block = (self.user_profiles[vector_ids] @ self.product_features.T).toarray()
+        # Fan the distinct-vector scores out to every product
+        return block[:, self.product_vector_ids]
+
+    def score_user(self, user_index):
+        return self.score_users([user_index])[0]
+
+    def score_rows(self, user_indices):
+        """(block, vector_ids) with block[i, vector_ids] the scores of user_indices[i] for every product.
+
+        In lazy mode block has one column per distinct product vector, so its
+        size does not grow with the catalog; vector_ids is None when block
+        already has one column per product.
+        """
+        if self.scores is not None:
+            return self.scores[user_indices], None
+        vector_ids = self.user_vector_ids[user_indices]
+        if self.unique_scores is not None:
+            return self.unique_scores[vector_ids], self.product_vector_ids
+        return (self.user_profiles[vector_ids] @ self.product_features.T).toarray(), self.product_vector_ids
 
+    def user_score_row(self, user_index):
+        """score_rows for one user: (row, vector_ids), without fanning out to every product."""
+        block, vector_ids = self.score_rows([user_index])
+        return block[0], vector_ids
+
+    @staticmethod
+    def gather_scores(score_row, vector_ids, indices=None):
+        """The scores of the products at indices (all products for None) from a user_score_row."""
+        if vector_ids is None:
+            return score_row if indices is None else score_row[indices]
+        return score_row[vector_ids if indices is None else vector_ids[indices]]
+
+    def rescore(self, indices, user_scores, purchase_vector):
+        """Weighted scores of the products at indices, given their plain scores and the customer's purchases."""
+        # Boost score for Purchase_History matches in Similar_Product_List
+        matches = self.similar_items[indices] @ purchase_vector
+        boost = np.where(matches, 0.5, 0)
+        # Incorporate Probability_of_Recommendation and Average_Rating_of_Similar_Products
+        return user_scores * (1 + boost + self.probability_weight[indices] + self.similar_rating_weight[indices])
+
+    def excluded_positions(self, product_ids):
+        """Catalog positions of product_ids, for the exclude argument of the ranking; None stays None."""
+        if product_ids is None:
+            return None
+        rows = self.product_rows
+        return np.asarray(sorted(rows[pid] for pid in product_ids if pid in rows), dtype=np.int64)
+
+    def get_recommendations(self, user_id, top_k, exclude=None):
+        """Top top_k Product_IDs for user_id, never recommending any Product_ID in exclude."""
+        if user_id not in self.user_index:
+            raise ValueError(f"User ID {user_id} not found in customer IDs.")
+        
+        user_index = self.user_index[user_id]
+        excluded = self.excluded_positions(exclude)
+        if self.sharded is not None:
+            with metrics.timer('rank_sharded'):
+                return self.product_ids[self.sharded.rank(user_id, top_k, excluded)].tolist()
+        with metrics.timer('score'):
+            score_row, vector_ids = self.user_score_row(user_index)
+        with metrics.timer('rank'):
+            return self._rank(user_id, score_row, vector_ids, top_k, excluded)
+
+    def get_recommendations_batch(self, user_ids, top_k, block_size=256, exclude=None):
+        """Recommendations for many users, scoring them block_size users at a time.
+
+        Returns a list aligned with user_ids. Peak memory for the scores is
+        one block_size x n_distinct_product_vectors block (block_size x
+        n_products in dense mode) regardless of len(user_ids).
+        exclude, if given, holds each user's excluded Product_IDs (or None), aligned with user_ids.
+        """
+        missing = [user_id for user_id in user_ids if user_id not in self.user_index]
+        if missing:
+            raise ValueError(f"User IDs {missing[:5]} not found in customer IDs.")
+
+        if self.sharded is not None:
+            # Every user is already spread over all the shards
+            return [self.get_recommendations(user_id, top_k, None if exclude is None else exclude[i])
+                    for i, user_id in enumerate(user_ids)]
+
+        results = []
+        for start in range(0, len(user_ids), block_size):
+            block_ids = user_ids[start:start + block_size]
+            with metrics.timer('score_batch'):
+                block_scores, vector_ids = self.score_rows([self.user_index[user_id] for user_id in block_ids])
+            with metrics.timer('rank_batch'):
+                for offset, (user_id, score_row) in enumerate(zip(block_ids, block_scores)):
+                    excluded = None if exclude is None else self.excluded_positions(exclude[start + offset])
+                    results.append(self._rank(user_id, score_row, vector_ids, top_k, excluded))
+        return results
+
+    def price_range(self, customer_row):
+        """(min_price, max_price) of the candidates for the customer at customer_row."""
+        avg_order_value = self.avg_order_values[customer_row]
+        return avg_order_value - self.price_window, avg_order_value + self.price_window
+
+    def fallback_ranking(self, user_id, score_row, vector_ids, top_k, excluded=None):
+        """Product indices to recommend when no product passes the filters and the exclusion.
+
+        If only the exclusion emptied the candidates, e.g. the user has been
+        shown all of them recently, they are ranked again as if nothing were
+        excluded: a repeat beats a product outside the filters. Otherwise the
+        user's top scores, without the filters.
+        """
+        if excluded is not None and len(excluded):
+            customer_row = self.customer_rows[user_id]
+            if len(self.candidate_index.candidates(self.allowed_categories, *self.price_range(customer_row))):
+                return self._rank_indices(user_id, score_row, vector_ids, top_k)
+        logger.warning(f"No valid recommendations found for {user_id}. Using top scores without strict filters.")
+        return without(np.argsort(self.gather_scores(score_row, vector_ids))[::-1], excluded)[:top_k]
+
+    def _rank(self, user_id, score_row, vector_ids, top_k, excluded=None):
         # Map indices to Product_IDs
-        recommended_product_ids = [int(self.product_data.iloc[i]['Product_ID'].replace('P', '')) for i in recommended_indices if i < len(self.product_data)]
-        return recommended_product_ids[:top_k]
+        return self.product_ids[self._rank_indices(user_id, score_row, vector_ids, top_k, excluded)].tolist()
+
+    def _rank_indices(self, user_id, score_row, vector_ids, top_k, excluded=None):
+        # Dynamic filters based on user data
+        customer_row = self.customer_rows[user_id]
+        min_price, max_price = self.price_range(customer_row)
+
+        # Filter products: category, price window and rating, from the candidate index
+        valid_indices = self.candidate_index.candidates(self.allowed_categories, min_price, max_price)
+        # Products the caller excluded, e.g. recently shown ones, are not candidates unless nothing else is (see fallback_ranking)
+        valid_indices = without(valid_indices, excluded)
+
+        if len(valid_indices) == 0:
+            recommended_indices = self.fallback_ranking(user_id, score_row, vector_ids, top_k, excluded)
+        else:
+            # Limit to 2 per brand, keeping the first ones in catalog order
+            valid_indices = valid_indices[_first_n_per_group(self.brand_codes[valid_indices], 2)]
+
+            user_scores = self.gather_scores(score_row, vector_ids, valid_indices)
+            weighted_scores = self.rescore(valid_indices, user_scores, self.customer_purchase_vector(customer_row))
+
+            if len(valid_indices) == 0:
+                recommended_indices = self.fallback_ranking(user_id, score_row, vector_ids, top_k, excluded)
+            else:
+                recommended_indices = valid_indices[_top_k(weighted_scores, valid_indices, top_k)]
+        return recommended_indices[:top_k]
 
     def get_recommendation_details(self, user_id, top_k):
         """Helper method to return details of recommendations for debugging."""
         recommendations = self.get_recommendations(user_id, top_k)
-        details = self.product_data[self.product_data['Product_ID'].str.replace('P', '').astype(int).isin(recommendations)].copy()
+        details = self.product_data[np.isin(self.product_ids, recommendations)].copy()
         details['Description'] = details.apply(
             lambda row: f"{row['Brand']} {row['Subcategory']} in {row['Category']}", axis=1
         )
-        return details
\ No newline at end of file
+        return details
+
+
+def _to_csr(matrix):
+    if sp.issparse(matrix):
+        return matrix.tocsr()
+    return sp.csr_matrix(np.asarray(matrix, dtype=np.float64))
+
+
+def _to_dense(matrix):
+    if sp.issparse(matrix):
+        return matrix.toarray()
+    # A copy: update_user and upsert_product write rows in place, and pandas 3 hands out read-only views
+    return np.array(matrix, dtype=np.float64)
+
+
+def _canonical_row(row):
+    row = _to_csr(row)
+    row.sum_duplicates()
+    row.sort_indices()
+    return row
+
+
+def _parse_list(value):
+    if isinstance(value, str):
+        return ast.literal_eval(value) if value else []
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return value
+    return []
+
+
+def _first_n_per_group(codes, n):
+    """Mask keeping the first n occurrences of each code, in order."""
+    return rank_in_group(codes) < n
+
+
+def _top_k(scores, indices, k):
+    """Positions of the k best scores, ties broken by the higher index like a descending tuple sort."""
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.arange(len(scores))
+    if len(scores) > k:
+        # argpartition finds the k-th best score; everything tied with it stays a candidate
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        candidates = np.flatnonzero(scores >= kth)
+    order = np.lexsort((-indices[candidates], -scores[candidates]))
+    return candidates[order[:k]]
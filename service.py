@@ -0,0 +1,424 @@
+import logging
+import os
+import time
+from collections import Counter
+from itertools import chain
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader
+from sklearn.feature_extraction.text import TfidfVectorizer
+from catalog import load_catalog, CUSTOMER_LIST_COLS
+from user_profiling import UserProfilingAgent
+from product_analysis import ProductAnalysisAgent
+from recommendation import RecommendationAgent
+from metrics import metrics
+from model_bundle import ModelBundle, model_version
+
+CUSTOMER_DATA_PATH = 'customer_data_collection.csv'
+PRODUCT_DATA_PATH = 'product_recommendation_data.csv'
+CATALOG_CACHE_PATH = 'catalog_cache.npz'
+MODEL_BUNDLE_PATH = 'model_bundle'
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+REQUIRED_CUSTOMER_COLS = ['Customer_ID', 'Age', 'Gender', 'Location', 'Browsing_History',
+                          'Purchase_History', 'Customer_Segment', 'Avg_Order_Value', 'Holiday', 'Season']
+
+# Product columns served to clients, see get_recommended_product_records
+PRODUCT_RECORD_COLS = ['Product_ID', 'Category', 'Subcategory', 'Brand', 'Price', 'Product_Rating']
+
+logger = logging.getLogger(__name__)
+# Templates are compiled on first use and kept for the life of the process
+_templates = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, auto_reload=False)
+
+
+class RecommendationService:
+    """Loads the data and builds the agents once, then serves recommendations from memory."""
+
+    def __init__(self, customer_data_path=CUSTOMER_DATA_PATH, product_data_path=PRODUCT_DATA_PATH, catalog_cache_path=CATALOG_CACHE_PATH,
+                 store=None, max_age_seconds=None, cache=None, model_bundle_path=MODEL_BUNDLE_PATH, shards=1,
+                 exclude_shown_seconds=None, served=False):
+        self.customer_data_path = customer_data_path
+        self.product_data_path = product_data_path
+        # Optional RecommendationStore. Computed recommendations are recorded there, and
+        # with max_age_seconds set a user's last recommendations are reused while fresh.
+        self.store = store
+        self.max_age_seconds = max_age_seconds
+        # served: every list returned here is shown to a user, so the store records it as an exposure.
+        # With a store, products shown to a user within exclude_shown_seconds are not recommended again
+        self.served = served
+        self.exclude_shown_seconds = exclude_shown_seconds
+        # Optional RecommendationCache in front of everything else
+        self.cache = cache
+        # shards > 1 ranks every request over that many slices of the catalog in parallel (see ShardedRanker)
+        self.shards = shards
+
+        with metrics.timer('load_catalog'):
+            self.catalog = load_catalog(customer_data_path, product_data_path, catalog_cache_path)
+        customer_data = self.catalog.customer_data
+        product_data = self.catalog.product_data
+
+        # Ensure all required columns are present
+        required_cols = [col for col in REQUIRED_CUSTOMER_COLS if col not in CUSTOMER_LIST_COLS]
+        missing_cols = [col for col in required_cols if col not in customer_data.columns]
+        if missing_cols:
+            print(f"Warning: Missing columns in customer_data: {missing_cols}")
+            customer_data = customer_data.reindex(columns=required_cols, fill_value='N/A')
+
+        self.customer_data = customer_data
+        self.customer_rows = self.catalog.customer_rows
+        # When each user's history, and the catalog as a whole, last changed (see _freshness_window)
+        self.user_updated_at = {}
+        self.catalog_updated_at = None
+
+        # The agents share the catalog rather than parsing the CSVs again
+        self.vectorizer = TfidfVectorizer()
+        self.user_agent = UserProfilingAgent(self.catalog, self.vectorizer)
+        self.product_agent = ProductAnalysisAgent(self.catalog, self.vectorizer)
+
+        # A model bundle for the current CSVs replaces the vectorizer fit and all the vector and score building
+        bundle = None
+        self.model_version = None
+        if model_bundle_path is not None:
+            # Keyed on the same CSV checksums as the catalog cache, computed once by load_catalog
+            checksums = self.catalog.checksums
+            with metrics.timer('load_model_bundle'):
+                bundle = ModelBundle.load(model_bundle_path, checksums)
+            self.model_version = model_version(checksums)
+        if bundle is not None:
+            bundle.restore_vectorizer(self.vectorizer)
+            with metrics.timer('build_scores'):
+                self.rec_agent = RecommendationAgent(bundle.user_profiles, bundle.product_features,
+                                                     self.catalog.customer_ids, product_data, customer_data,
+                                                     catalog=self.catalog, user_vector_ids=bundle.user_vector_ids,
+                                                     product_vector_ids=bundle.product_vector_ids,
+                                                     unique_scores=bundle.unique_scores, columns=bundle.columns,
+                                                     shards=shards)
+        else:
+            self._fit_vectorizer()
+
+            # Distinct vectors only; the agent scores distinct users x distinct products once and fans out
+            user_profiles, user_vector_ids, product_features, product_vector_ids = self._unique_vectors()
+
+            with metrics.timer('build_scores'):
+                self.rec_agent = RecommendationAgent(user_profiles, product_features, self.catalog.customer_ids,
+                                                     product_data, customer_data, catalog=self.catalog,
+                                                     user_vector_ids=user_vector_ids, product_vector_ids=product_vector_ids,
+                                                     shards=shards)
+            if model_bundle_path is not None:
+                with metrics.timer('save_model_bundle'):
+                    bundle = ModelBundle.from_agent(self.model_version, self.vectorizer, self.rec_agent)
+                    bundle.save(model_bundle_path, checksums)
+
+        if self.store is not None:
+            with metrics.timer('store_products'):
+                self.store.upsert_products(product_data, version=self.catalog.product_version)
+        if self.cache is not None:
+            if self.cache.model_version is None:
+                self.cache.model_version = self.catalog.version
+            # Entries persisted for other catalog versions, or expired, are deleted rather than left behind
+            self.cache.prune()
+
+    def _fit_vectorizer(self):
+        with metrics.timer('fit_vectorizer'):
+            # Streamed chunk by chunk; fit accepts any iterable of documents
+            all_text = chain.from_iterable(chain(self.user_agent.iter_preference_text(),
+                                                 self.product_agent.iter_feature_text()))
+            self.vectorizer.fit(all_text)
+
+    def _unique_vectors(self):
+        with metrics.timer('user_profiles'):
+            user_profiles, user_vector_ids = self.user_agent.get_unique_user_profiles()
+        with metrics.timer('product_features'):
+            product_features, product_vector_ids = self.product_agent.get_unique_product_features()
+        return user_profiles, user_vector_ids, product_features, product_vector_ids
+
+    # The recommendation agent owns the product table once products can be upserted
+    @property
+    def product_data(self):
+        return self.rec_agent.product_data
+
+    @property
+    def product_ids(self):
+        return self.rec_agent.product_ids
+
+    @property
+    def product_rows(self):
+        return self.rec_agent.product_rows
+
+    def record_user_events(self, user_id, browsing=(), purchases=()):
+        """Append browsing/purchase events for one user and update only that user's profile.
+
+        The vocabulary is not refitted; call refit() periodically for that.
+        """
+        if not self.has_user(user_id):
+            raise ValueError(f"User ID {user_id} not found in customer IDs.")
+        row = self.customer_rows[user_id]
+        # Also updates the catalog's history lists
+        profile_row = self.user_agent.append_events(user_id, browsing, purchases)
+        self.rec_agent.update_user(user_id, profile_row, self.catalog.list_column('Purchase_History', row))
+        self.user_updated_at[user_id] = time.time()
+        self.invalidate_user(user_id)
+
+    def upsert_product(self, product):
+        """Add or update one product (a dict of product CSV columns) without refitting the vocabulary."""
+        row, feature_row = self.product_agent.upsert_product(product)
+        position = self.rec_agent.upsert_product(product, feature_row)
+        if row != position:
+            raise RuntimeError(f"Product rows out of sync: {row} in product agent, {position} in recommendation agent.")
+        if self.store is not None:
+            self.store.upsert_products(self.product_data.iloc[[position]])
+        self.catalog_updated_at = time.time()
+        self.invalidate_catalog()
+
+    def refit(self):
+        """Full refit: relearn the vocabulary/IDF from the current data and rebuild every vector."""
+        self._fit_vectorizer()
+        user_profiles, user_vector_ids, product_features, product_vector_ids = self._unique_vectors()
+        with metrics.timer('build_scores'):
+            self.rec_agent.set_vectors(user_profiles, product_features, user_vector_ids, product_vector_ids)
+        self.catalog_updated_at = time.time()
+        self.invalidate_catalog()
+
+    def _freshness_window(self, user_id):
+        """Seconds for which stored recommendations can be reused, shortened so nothing older than the user's
+        or the catalog's last change is served. None means do not reuse."""
+        if self.store is None or self.max_age_seconds is None:
+            return None
+        window = self.max_age_seconds
+        now = time.time()
+        for updated_at in (self.user_updated_at.get(user_id), self.catalog_updated_at):
+            if updated_at is not None:
+                # Stored timestamps have one second resolution
+                window = min(window, int(now - updated_at) - 1)
+        return window if window > 0 else None
+
+    def has_user(self, user_id):
+        return user_id in self.customer_rows
+
+    def recommend(self, user_id, top_k):
+        recommendations = self.cache.get(user_id, top_k) if self.cache is not None else None
+        if recommendations is not None:
+            metrics.count('recommendations_cached')
+        else:
+            recommendations = self._recommend_uncached(user_id, top_k)
+            if self.cache is not None:
+                self.cache.put(user_id, top_k, recommendations)
+        if self._records_exposures():
+            with metrics.timer('store_exposures'):
+                self.store.record_exposures(user_id, recommendations)
+        return recommendations
+
+    def recommend_batch(self, requests):
+        """recommend() for a list of (user_id, top_k) pairs, returning a list aligned with it.
+
+        Whatever the cache and the store cannot answer is scored in one
+        get_recommendations_batch call at the largest top_k (each shorter list
+        is a prefix of it) and written to the store in one transaction.
+        """
+        results = [None] * len(requests)
+        missing = []
+        for i, (user_id, top_k) in enumerate(requests):
+            if self.cache is not None:
+                cached = self.cache.get(user_id, top_k)
+                if cached is not None:
+                    metrics.count('recommendations_cached')
+                    results[i] = cached
+                    continue
+            results[i] = self._stored_recommendations(user_id, top_k)
+            if results[i] is None:
+                missing.append(i)
+            elif self.cache is not None:
+                self.cache.put(user_id, top_k, results[i])
+        if not missing:
+            self._record_batch_exposures(requests, results)
+            return results
+
+        user_ids = list(dict.fromkeys(requests[i][0] for i in missing))
+        max_top_k = max(requests[i][1] for i in missing)
+        exclude = [self._excluded_products(user_id) for user_id in user_ids] if self._excludes_shown() else None
+        computed = dict(zip(user_ids, self.rec_agent.get_recommendations_batch(user_ids, max_top_k, exclude=exclude)))
+        metrics.count('recommendations_computed', len(missing))
+        longest = {}
+        for i in missing:
+            user_id, top_k = requests[i]
+            results[i] = computed[user_id][:top_k]
+            longest[user_id] = max(longest.get(user_id, 0), top_k)
+            if self.cache is not None:
+                self.cache.put(user_id, top_k, results[i])
+        if self.store is not None:
+            # One list per user, so a later get_last_recommendations does not mix two lengths
+            rows = [(user_id, product_id) for user_id, top_k in longest.items() for product_id in computed[user_id][:top_k]]
+            with metrics.timer('store_recommendations'):
+                self.store.save_recommendations(rows, served=self.served)
+        self._record_batch_exposures(requests, results)
+        return results
+
+    def _stored_recommendations(self, user_id, top_k):
+        """The user's stored recommendations while they are fresh, else None."""
+        window = self._freshness_window(user_id)
+        if window is not None:
+            # A longer stored list is still valid: the top-k ranking is a prefix of any longer one
+            last = self.store.get_last_recommendations(user_id, window)
+            if len(last) >= top_k:
+                metrics.count('recommendations_stored')
+                return last[:top_k]
+        return None
+
+    def _recommend_uncached(self, user_id, top_k):
+        stored = self._stored_recommendations(user_id, top_k)
+        if stored is not None:
+            return stored
+        recommendations = self.rec_agent.get_recommendations(user_id, top_k, exclude=self._excluded_products(user_id))
+        metrics.count('recommendations_computed')
+        if self.store is not None:
+            with metrics.timer('store_recommendations'):
+                self.store.save_recommendations([(user_id, product_id) for product_id in recommendations],
+                                                served=self.served)
+        return recommendations
+
+    def _records_exposures(self):
+        return self.store is not None and self.served
+
+    def _record_batch_exposures(self, requests, results):
+        """Every list of a recommend_batch call counts as shown, wherever it came from; one transaction."""
+        if self._records_exposures():
+            with metrics.timer('store_exposures'):
+                self.store.record_exposure_rows((user_id, product_id) for (user_id, _), recommendations
+                                                in zip(requests, results) for product_id in recommendations)
+
+    def _excludes_shown(self):
+        return self.store is not None and self.exclude_shown_seconds is not None
+
+    def _excluded_products(self, user_id):
+        """Products recently recommended to the user, to leave out of a new ranking, or None."""
+        if not self._excludes_shown():
+            return None
+        # The stored run that is still fresh is the user's current list rather than a repeat, so it
+        # stays eligible: a request for a larger k then extends that list instead of replacing it
+        with metrics.timer('load_exposures'):
+            return self.store.get_recent_exposures(user_id, self.exclude_shown_seconds, self._freshness_window(user_id))
+
+    def invalidate_user(self, user_id):
+        """Forget cached recommendations for a user whose history changed."""
+        if self.cache is not None:
+            self.cache.invalidate_user(user_id)
+
+    def invalidate_catalog(self):
+        """Forget all cached recommendations after the product catalog changed."""
+        if self.cache is not None:
+            self.cache.invalidate_all()
+
+    def get_user_details(self, user_id):
+        """Return (user_details, preferences, username) for the user, with defaults for unknown users."""
+        row = self.customer_rows.get(user_id)
+        if row is None:
+            print(f"Warning: No data found for User ID {user_id}. Using default values.")
+            user_details = {
+                'Customer_ID': user_id, 'Age': 'N/A', 'Gender': 'N/A', 'Location': 'N/A',
+                'Browsing_History': [], 'Purchase_History': [], 'Customer_Segment': 'N/A',
+                'Avg_Order_Value': 'N/A', 'Holiday': 'N/A', 'Season': 'N/A'
+            }
+            return user_details, "No history available", "Unknown User"
+        user_details = self.customer_data.iloc[row].to_dict()
+        for col in CUSTOMER_LIST_COLS:
+            user_details[col] = self.catalog.list_column(col, row)
+        preferences = ' '.join(user_details['Purchase_History']) + " " + ' '.join(user_details['Browsing_History'])
+        username = user_details.get('Username', f"User_{user_id}")
+        return user_details, preferences, username
+
+    def _recommended_rows(self, recommendations, top_k, rank_order):
+        rows = [self.product_rows[pid] for pid in recommendations if pid in self.product_rows]
+        if not rank_order:
+            # Keep catalog order, as the boolean-mask lookup this replaces did
+            rows = sorted(rows)
+        if not rows:
+            print(f"Warning: No matching products found for recommendations {recommendations}. Using top {top_k} from product_data.")
+            rows = list(range(min(top_k, len(self.product_data))))
+        return rows
+
+    def get_recommended_product_records(self, recommendations, top_k, rank_order=False):
+        """The recommended products as plain dicts with a Description, read straight from the column arrays.
+
+        Building a small DataFrame per request costs far more than the scoring itself.
+        """
+        rows = self._recommended_rows(recommendations, top_k, rank_order)
+        columns = {col: _column_values(self.product_data[col], rows) for col in PRODUCT_RECORD_COLS}
+        records = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        for record in records:
+            record['Description'] = f"{record['Brand']} {record['Subcategory']} in {record['Category']}"
+        return records
+
+    def get_recommendations_json(self, user_id, top_k):
+        return self.recommendations_json(user_id, top_k, self.recommend(user_id, top_k))
+
+    def recommendations_json(self, user_id, top_k, recommendations):
+        """The JSON payload for already computed recommendations."""
+        with metrics.timer('render_json'):
+            recommended_products = self.get_recommended_product_records(recommendations, top_k, rank_order=True)
+            products = []
+            for product in recommended_products:
+                products.append({
+                    'product_id': int(str(product['Product_ID']).replace('P', '')),
+                    'category': product['Category'],
+                    'subcategory': product['Subcategory'],
+                    'brand': product['Brand'],
+                    'description': product['Description'],
+                    'price': float(product['Price']) if pd.notna(product['Price']) else None,
+                    'rating': float(product['Product_Rating']) if pd.notna(product['Product_Rating']) else None,
+                })
+        return {'user_id': user_id, 'top_k': top_k, 'recommendations': products}
+
+    def recommendations_html(self, user_id, top_k, recommendations):
+        """The HTML page for already computed recommendations."""
+        user_details, _, username = self.get_user_details(user_id)
+        recommended_products = self.get_recommended_product_records(recommendations, top_k)
+        return render_recommendations_html(user_id, username, user_details, recommended_products)
+
+    def get_recommendations_html_stream(self, user_id, top_k):
+        """The recommendations page for user_id as a generator of text chunks, for a streamed response."""
+        user_details, _, username = self.get_user_details(user_id)
+        recommended_products = self.get_recommended_product_records(self.recommend(user_id, top_k), top_k)
+        return stream_recommendations_html(user_id, username, user_details, recommended_products)
+
+
+def _column_values(series, rows):
+    """series[rows] as a NumPy array, without materializing a whole categorical column."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.to_numpy()[series.cat.codes.to_numpy()[rows]]
+    return series.to_numpy()[rows]
+
+def render_recommendations_html(user_id, username, user_details, recommended_products):
+    with metrics.timer('render_html'):
+        return ''.join(stream_recommendations_html(user_id, username, user_details, recommended_products))
+
+def stream_recommendations_html(user_id, username, user_details, recommended_products):
+    """Render the recommendations page chunk by chunk from product records (get_recommended_product_records)."""
+    template = _templates.get_template('recommendations.html')
+    return template.generate(_page_context(user_id, username, user_details, recommended_products))
+
+def _page_context(user_id, username, user_details, recommended_products):
+    # Analyze preferences for color scheme and chart data
+    purchase_words = user_details['Purchase_History'] if user_details['Purchase_History'] else []
+    browsing_words = user_details['Browsing_History'] if user_details['Browsing_History'] else []
+    all_words = purchase_words + browsing_words
+    word_freq = Counter(all_words)
+    top_categories = word_freq.most_common(5)
+    color = '#4CAF50' if 'Books' in all_words else '#2196F3' if 'Fashion' in all_words else '#FF9800'
+
+    products = []
+    for product in recommended_products:
+        product_id = int(str(product['Product_ID']).replace('P', ''))
+        price = product['Price'] if pd.notna(product['Price']) else 'N/A'
+        rating = product['Product_Rating'] if pd.notna(product['Product_Rating']) else 'N/A'
+        products.append({'id': product_id, 'description': product['Description'], 'price': price, 'rating': rating})
+        logger.debug(f"Recommended Product Check: ID={product_id}, Category={product['Category']}, Price=${price}, Rating={rating}")
+
+    return {
+        'user_id': user_id,
+        'username': username,
+        'user_details': user_details,
+        'color': color,
+        'products': products,
+        'chart_labels': [cat[0] for cat in top_categories],
+        'chart_data': [cat[1] for cat in top_categories],
+    }
+
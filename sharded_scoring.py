@@ -0,0 +1,99 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from candidate_index import CandidateIndex
+from utils import rank_in_group, without
+
+# Brand cap of the ranking: at most this many products per brand, the first ones in catalog order
+MAX_PER_BRAND = 2
+
+
+class ProductShard:
+    """A contiguous range of catalog positions [start, stop) with its own candidate index.
+
+    The shard reads the agent's column arrays at call time, so it only has to
+    be told about upserts that change which products pass the filters.
+    """
+
+    def __init__(self, agent, start, stop):
+        self.start = start
+        self.stop = stop
+        self.candidate_index = CandidateIndex(agent.categories[start:stop], agent.prices[start:stop],
+                                              agent.ratings[start:stop], agent.min_rating)
+
+    def rank(self, agent, score_row, vector_ids, purchase_vector, min_price, max_price, excluded=None):
+        """This shard's candidates after its local brand cap, best first.
+
+        Returns (positions, brand codes, rank within brand, weighted scores),
+        sorted by weighted score and then position, both descending.
+        """
+        positions = self.start + self.candidate_index.candidates(agent.allowed_categories, min_price, max_price)
+        positions = without(positions, excluded)
+        codes = agent.brand_codes[positions]
+        ranks = rank_in_group(codes)
+        # Later products of a brand can never make the global cap either
+        keep = ranks < MAX_PER_BRAND
+        positions, codes, ranks = positions[keep], codes[keep], ranks[keep]
+        user_scores = agent.gather_scores(score_row, vector_ids, positions)
+        weighted_scores = agent.rescore(positions, user_scores, purchase_vector)
+        order = np.lexsort((-positions, -weighted_scores))
+        return positions[order], codes[order], ranks[order], weighted_scores[order]
+
+
+class ShardedRanker:
+    """RecommendationAgent's filter, re-score and top-k, split over n_shards slices of the catalog.
+
+    Each shard ranks its own slice on a thread of a shared pool. The shards
+    share the agent's arrays, and the NumPy and SciPy kernels doing the work
+    release the GIL. The brand cap is global: a product survives only if fewer
+    than MAX_PER_BRAND products of its brand pass the filters at earlier
+    catalog positions. That is decided from the shards' local brand ranks,
+    taken in shard order. The surviving per-shard rankings are then merged
+    with a k-way heap. The result is identical to the single-shard ranking.
+    """
+
+    def __init__(self, agent, n_shards):
+        self.agent = agent
+        self.n_shards = n_shards
+        bounds = np.linspace(0, len(agent.product_ids), n_shards + 1).astype(np.int64)
+        self.shards = [ProductShard(agent, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.executor = ThreadPoolExecutor(max_workers=n_shards, thread_name_prefix='shard')
+
+    def update(self, position, category, price, rating):
+        """Reflect a changed or appended product; appended ones join the last shard."""
+        for shard in self.shards:
+            if shard.start <= position < shard.stop or shard is self.shards[-1]:
+                shard.stop = max(shard.stop, position + 1)
+                shard.candidate_index.update(position - shard.start, category, price, rating)
+                return
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def rank(self, user_id, top_k, excluded=None):
+        """Product indices of the top_k recommendations for user_id, as RecommendationAgent._rank returns them."""
+        agent = self.agent
+        user_index = agent.user_index[user_id]
+        customer_row = agent.customer_rows[user_id]
+        min_price, max_price = agent.price_range(customer_row)
+        score_row, vector_ids = agent.user_score_row(user_index)
+        purchase_vector = agent.customer_purchase_vector(customer_row)
+
+        results = list(self.executor.map(
+            lambda shard: shard.rank(agent, score_row, vector_ids, purchase_vector, min_price, max_price, excluded),
+            self.shards))
+
+        if not any(len(positions) for positions, _, _, _ in results):
+            return agent.fallback_ranking(user_id, score_row, vector_ids, top_k, excluded)
+
+        # Products of each brand already passing the filters in earlier shards
+        seen = np.zeros(len(agent.brands), dtype=np.int64)
+        streams = []
+        for positions, codes, ranks, weighted_scores in results:
+            survive = seen[codes] + ranks < MAX_PER_BRAND
+            np.add.at(seen, codes, 1)
+            positions, weighted_scores = positions[survive][:top_k], weighted_scores[survive][:top_k]
+            streams.append(zip((-weighted_scores).tolist(), (-positions).tolist()))
+        best = islice(heapq.merge(*streams), max(top_k, 0))
+        return np.asarray([-position for _, position in best], dtype=np.int64)
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+from utils import unique_rows
+
+
+class SimilarProductIndex:
+    """Top-k most similar products per product, by cosine similarity of their feature vectors.
+
+    Holds only the N x k neighbour table instead of the N x N similarity matrix.
+    Building it scores each *distinct* feature vector once, block by block,
+    so products with identical Category/Subcategory/Brand vectors share the
+    work; memory during the build is block_size x n_distinct.
+    """
+
+    def __init__(self, product_ids, neighbors, scores):
+        self.product_ids = np.asarray(product_ids)
+        self.neighbors = neighbors  # (N, k) row positions into product_ids, -1 where there are fewer than k
+        self.scores = scores  # (N, k) cosine similarities
+        self.product_rows = {pid: i for i, pid in enumerate(self.product_ids.tolist())}
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def build(cls, feature_vectors, product_ids, k=10, block_size=1024):
+        vectors = normalize(sp.csr_matrix(feature_vectors, dtype=np.float64))
+        n_products = vectors.shape[0]
+
+        # Products with identical vectors share one entry
+        unique_vectors, group_of, _ = unique_rows(vectors)
+        n_groups = unique_vectors.shape[0]
+
+        order = np.argsort(group_of, kind='stable')
+        group_starts = np.searchsorted(group_of[order], np.arange(n_groups + 1))
+        members = [order[group_starts[g]:group_starts[g + 1]] for g in range(n_groups)]
+
+        neighbors = np.full((n_products, k), -1, dtype=np.int32)
+        scores = np.zeros((n_products, k), dtype=np.float32)
+        # k + 1 candidates per group, so each member still has k after removing itself
+        n_candidates = min(k + 1, n_groups)
+        for start in range(0, n_groups, block_size):
+            block = (unique_vectors[start:start + block_size] @ unique_vectors.T).toarray()
+            top_groups = np.argpartition(-block, n_candidates - 1, axis=1)[:, :n_candidates]
+            for offset, group_scores in enumerate(block):
+                g = start + offset
+                ranked = top_groups[offset][np.argsort(-group_scores[top_groups[offset]], kind='stable')]
+                candidates = np.concatenate([members[h] for h in ranked])[:k + 1]
+                candidate_scores = group_scores[group_of[candidates]]
+                for product in members[g]:
+                    keep = candidates != product
+                    row_neighbors = candidates[keep][:k]
+                    neighbors[product, :len(row_neighbors)] = row_neighbors
+                    scores[product, :len(row_neighbors)] = candidate_scores[keep][:k]
+        return cls(product_ids, neighbors, scores)
+
+    def most_similar(self, product_id, k=None):
+        """[(product_id, similarity), ...] for the k products most similar to product_id."""
+        if product_id not in self.product_rows:
+            raise ValueError(f"Product ID {product_id} not found in similarity index.")
+        k = self.k if k is None else min(k, self.k)
+        row = self.product_rows[product_id]
+        neighbors = self.neighbors[row, :k]
+        valid = neighbors >= 0
+        return list(zip(self.product_ids[neighbors[valid]].tolist(), self.scores[row, :k][valid].tolist()))
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, product_ids=self.product_ids, neighbors=self.neighbors, scores=self.scores)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['product_ids'], data['neighbors'], data['scores'])
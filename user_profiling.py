@@ -1,23 +1,82 @@
+import ast
 import pandas as pd
-from utils import load_data
+import scipy.sparse as sp
+from catalog import Catalog, CUSTOMER_DTYPES
+from utils import load_data, unique_rows_chunked, DEFAULT_CHUNK_SIZE
 
 class UserProfilingAgent:
-    def __init__(self, customer_data_path, vectorizer):
-        self.customer_data = load_data(customer_data_path)
+    def __init__(self, customer_data, vectorizer, chunk_size=DEFAULT_CHUNK_SIZE):
+        # customer_data is a CSV path, an already-loaded DataFrame or a shared Catalog, so the CSV is parsed once
+        self.catalog = customer_data if isinstance(customer_data, Catalog) else None
+        if self.catalog is not None:
+            customer_data = self.catalog.customer_data
+        elif not isinstance(customer_data, pd.DataFrame):
+            customer_data = load_data(customer_data, CUSTOMER_DTYPES)
+        self.customer_data = customer_data
         if self.customer_data is None:
             raise ValueError("Customer data could not be loaded.")
         self.vectorizer = vectorizer
+        self.chunk_size = chunk_size
+        self.customer_rows = {cid: i for i, cid in enumerate(self.customer_data['Customer_ID'])}
 
-    def generate_preference_vectors(self):
+    def generate_preference_text(self, start=0, stop=None):
+        """Preference text of the customers in rows [start, stop)."""
+        if self.catalog is not None:
+            # Joining the parsed items gives the same tokens as the raw list strings
+            purchases = self.catalog.list_column('Purchase_History', start=start, stop=stop)
+            browsing = self.catalog.list_column('Browsing_History', start=start, stop=stop)
+            return pd.Series([' '.join(p) + ' ' + ' '.join(b) for p, b in zip(purchases, browsing)],
+                             index=pd.RangeIndex(start, start + len(purchases)), dtype=object)
         if 'Purchase_History' not in self.customer_data.columns or 'Browsing_History' not in self.customer_data.columns:
             raise KeyError("Columns 'Purchase_History' and 'Browsing_History' not found in customer data.")
-        preference_data = self.customer_data['Purchase_History'].fillna('') + ' ' + \
-                         self.customer_data['Browsing_History'].fillna('')
-        preference_vectors = self.vectorizer.transform(preference_data)  # Use pre-fitted vectorizer
+        customer_data = self.customer_data.iloc[start:stop]
+        preference_data = customer_data['Purchase_History'].fillna('') + ' ' + \
+                         customer_data['Browsing_History'].fillna('')
+        return preference_data
+
+    def iter_preference_text(self):
+        """generate_preference_text() in chunks of chunk_size customers."""
+        n_rows = len(self.customer_data)
+        for start in range(0, max(n_rows, 1), self.chunk_size):
+            yield self.generate_preference_text(start, start + self.chunk_size)
+
+    def iter_preference_vectors(self):
+        for text in self.iter_preference_text():
+            yield self.vectorizer.transform(text)  # Use pre-fitted vectorizer
+
+    def generate_preference_vectors(self):
+        # Transformed chunk by chunk, so only one chunk's token lists exist at a time
+        preference_vectors = sp.vstack(list(self.iter_preference_vectors()), format='csr')
         return preference_vectors
 
-    def get_user_profiles(self):
+    def append_events(self, user_id, browsing=(), purchases=()):
+        """Append browsing/purchase events to one customer's history and return their new profile row.
+
+        Only this customer is re-transformed, with the already-fitted vectorizer,
+        so words it has never seen are ignored until the next full refit.
+        """
+        if user_id not in self.customer_rows:
+            raise ValueError(f"User ID {user_id} not found in customer data.")
+        row = self.customer_rows[user_id]
+        for col, events in (('Browsing_History', browsing), ('Purchase_History', purchases)):
+            if events:
+                if self.catalog is not None:
+                    self.catalog.set_list(col, row, self.catalog.list_column(col, row) + list(events))
+                    continue
+                history = self.customer_data[col].iloc[row]
+                history = ast.literal_eval(history) if isinstance(history, str) and history else []
+                self.customer_data.iloc[row, self.customer_data.columns.get_loc(col)] = str(history + list(events))
+        return self.vectorizer.transform(self.generate_preference_text(row, row + 1)).tocsr()
+
+    def get_unique_user_profiles(self):
+        """Distinct customer vectors and the vector id of every customer, so identical vectors are stored and scored once."""
+        unique, vector_ids, _ = unique_rows_chunked(self.iter_preference_vectors())
+        return unique, vector_ids
+
+    def get_user_profiles(self, sparse=False):
         preference_vectors = self.generate_preference_vectors()
+        if sparse:
+            return preference_vectors.tocsr()
         user_profiles = pd.DataFrame(preference_vectors.toarray(), 
                                    index=self.customer_data['Customer_ID'])
         return user_profiles
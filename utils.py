@@ -1,23 +1,127 @@
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
-def load_data(file_path):
+# Rows per chunk when streaming CSVs and transforming text
+DEFAULT_CHUNK_SIZE = 100_000
+
+def load_data(file_path, dtypes=None):
     try:
+        if dtypes is not None:
+            return pd.concat(read_csv_chunks(file_path, dtypes), ignore_index=True)
         data = pd.read_csv(file_path)
         return data
     except FileNotFoundError:
         print(f"Error: {file_path} not found.")
         return None
 
+def read_csv_chunks(file_path, dtypes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a CSV as DataFrames of at most chunk_size rows.
+
+    dtypes maps the columns to read to their dtype (None to infer it); other
+    columns are skipped, and listed columns missing from the file are ignored.
+    """
+    usecols = None
+    dtype = None
+    if dtypes is not None:
+        usecols = lambda col: col in dtypes
+        dtype = {col: col_dtype for col, col_dtype in dtypes.items() if col_dtype is not None}
+    with pd.read_csv(file_path, usecols=usecols, dtype=dtype, chunksize=chunk_size) as reader:
+        yield from reader
+
 def preprocess_data(data):
     data = data.fillna('')
     return data
 
-def evaluate_recommendations(true_labels, predicted_labels):
-    k = min(len(predicted_labels), 5)
+def row_key(matrix, i):
+    """Hashable key for row i of a CSR matrix with sorted indices; equal rows give equal keys."""
+    start, end = matrix.indptr[i], matrix.indptr[i + 1]
+    return matrix.indices[start:end].tobytes() + matrix.data[start:end].tobytes()
+
+def rank_in_group(codes):
+    """For each element, how many earlier elements share its code (0 for the first of each code)."""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(codes)])
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - np.repeat(group_starts, group_sizes)
+    return rank
+
+def without(indices, excluded):
+    """indices minus any in excluded (None for none), in their original order."""
+    if excluded is None or len(excluded) == 0:
+        return indices
+    return indices[~np.isin(indices, excluded)]
+
+def unique_rows(matrix):
+    """Deduplicate the rows of a sparse matrix.
+
+    Returns (unique, vector_ids, keys): the distinct rows as a CSR matrix in
+    order of first appearance, the unique row id of every input row, and a
+    dict mapping row_key() of each distinct row to its id.
+    """
+    return unique_rows_chunked([matrix])
+
+def unique_rows_chunked(matrices):
+    """unique_rows over the row-wise concatenation of a stream of sparse matrices, e.g. one per chunk.
+
+    Only the distinct rows are kept as the stream is consumed, so memory
+    grows with the number of distinct vectors rather than of input rows.
+    """
+    keys = {}
+    vector_ids = []
+    distinct = []
+    for matrix in matrices:
+        matrix = sp.csr_matrix(matrix)
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        ids = np.empty(matrix.shape[0], dtype=np.int64)
+        new_rows = []
+        for i in range(matrix.shape[0]):
+            key = row_key(matrix, i)
+            vector_id = keys.get(key)
+            if vector_id is None:
+                vector_id = keys[key] = len(keys)
+                new_rows.append(i)
+            ids[i] = vector_id
+        vector_ids.append(ids)
+        distinct.append(matrix[new_rows])
+    return sp.vstack(distinct, format='csr'), np.concatenate(vector_ids), keys
+
+def set_row(frame, i, record):
+    """Overwrite row i of frame in place with the {column: value} record, growing categoricals as needed."""
+    for col, value in record.items():
+        column = frame[col]
+        if isinstance(column.dtype, pd.CategoricalDtype) and value not in column.cat.categories:
+            frame[col] = column.cat.add_categories([value])
+        frame.iloc[i, frame.columns.get_loc(col)] = value
+
+def append_row(frame, record):
+    """A copy of frame with the record appended, keeping categorical columns categorical."""
+    appended = pd.concat([frame, pd.DataFrame([record], columns=frame.columns)], ignore_index=True)
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            appended[col] = appended[col].astype('category')
+    return appended
+
+def evaluate_recommendations(true_labels, predicted_labels, k=5):
+    k = min(len(predicted_labels), k)
     relevant = sum(1 for pred in predicted_labels[:k] if pred in true_labels)
     precision = relevant / k if k > 0 else 0
     return precision
 
+def recall_at_k(true_labels, predicted_labels, k=5):
+    true_labels = set(true_labels)
+    hits = true_labels.intersection(predicted_labels[:k])
+    return len(hits) / len(true_labels) if true_labels else 0
+
+def ndcg_at_k(true_labels, predicted_labels, k=5):
+    gains = [1 if pred in true_labels else 0 for pred in predicted_labels[:k]]
+    dcg = sum(gain / np.log2(rank + 2) for rank, gain in enumerate(gains))
+    ideal = sum(1 / np.log2(rank + 2) for rank in range(min(len(set(true_labels)), k)))
+    return dcg / ideal if ideal > 0 else 0
+
 if __name__ == "__main__":
     data = load_data('sample.csv')
     if data is not None: